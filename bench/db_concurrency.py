@@ -0,0 +1,85 @@
+"""
+Stress test for the SQLite connection layer: search throughput of reader threads
+with and without moex_marketdata_db_update committing in a loop.
+
+    python bench/db_concurrency.py [--readers 4] [--seconds 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from data import db  # noqa: E402
+from data.moex import MoexMarketData  # noqa: E402
+from synthetic import synthetic_bonds, synthetic_marketdata  # noqa: E402
+
+_queries = ['офз1', 'RU000A0001', 'SU0002', 'облиг 12']
+
+
+def _reader(stop: threading.Event, counts: list[int], i: int):
+    n = 0
+    while not stop.is_set():
+        # past the result cache, which would answer the repeated queries from memory
+        db._moex_bonds_search(_queries[n % len(_queries)], 100, 'shortname')
+        n += 1
+    counts[i] = n
+    db.db_close_connection()
+
+
+def _writer(stop: threading.Event, marketdata, commits: list[int]):
+    seed = 0
+    while not stop.is_set():
+        db.moex_marketdata_db_update(MoexMarketData(str(seed), marketdata[seed % len(marketdata)]))
+        seed += 1
+    commits[0] = seed
+    db.db_close_connection()
+
+
+def run(readers: int, seconds: float, with_writer: bool, marketdata) -> tuple[float, int]:
+    stop = threading.Event()
+    counts = [0] * readers
+    commits = [0]
+    threads = [threading.Thread(target=_reader, args=(stop, counts, i)) for i in range(readers)]
+    if with_writer:
+        threads.append(threading.Thread(target=_writer, args=(stop, marketdata, commits)))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return sum(counts) / seconds, commits[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db._db_name = os.path.join(tmp, 'bonds.db')
+        db.db_migrate()
+        bonds = synthetic_bonds()
+        db.moex_bonds_db_update(bonds)
+        marketdata = [synthetic_marketdata(bonds, seed) for seed in range(10)]
+        db.moex_marketdata_db_update(MoexMarketData(None, marketdata[0]))
+        # no snapshot is loaded, so searches read SQLite
+        assert db._snapshot is None
+
+        idle_rate, _ = run(args.readers, args.seconds, False, marketdata)
+        busy_rate, commits = run(args.readers, args.seconds, True, marketdata)
+        db.db_close_connection()
+
+    print(f'readers: {args.readers}, seconds: {args.seconds}')
+    print(f'searches/s without writer: {idle_rate:.0f}')
+    print(f'searches/s with writer:    {busy_rate:.0f} ({commits} marketdata commits)')
+    print(f'ratio: {busy_rate / idle_rate:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,413 @@
+"""
+End-to-end load test: the app in gunicorn, started the way the Dockerfile starts it, against a local
+ISS stand-in serving bench/fixtures, driven by concurrent users sending Dash callback requests.
+Latency percentiles and throughput are reported separately for the time with and without
+a MOEX data refresh in progress.
+
+    python bench/load_test.py [--users 50] [--seconds 180] [--marketdata-interval 60] [--mix search=3,calc=1]
+    python bench/load_test.py --server flask     # Flask dev server, when gunicorn isn't installed
+    python bench/load_test.py --url http://127.0.0.1:8050 --iss-port 8960
+                                                 # an app already started with MOEX_ISS_URL=http://<host>:8960/iss
+
+Refreshes are the securities and marketdata jobs: a refresh starts when the app requests their data
+from the stand-in and ends when the job duration histogram in /metrics counts the run.
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+
+from record_fixtures import read_fixture
+
+_src = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+_dockerfile = os.path.join(os.path.dirname(__file__), '..', 'Dockerfile')
+
+# share of marketdata rows with a new price in each poll, about what a trading minute changes
+_changed_share = 0.2
+# seconds between /metrics polls, the precision of refresh boundaries
+_metrics_poll = 0.2
+_refresh_jobs = ('update_securities', 'update_marketdata')
+_empty_bondization = json.dumps({
+    'coupons': {'columns': ['coupondate', 'value'], 'data': []},
+    'amortizations': {'columns': ['amortdate', 'value'], 'data': []},
+    'offers': {'columns': ['offerdate', 'price'], 'data': []},
+}).encode()
+
+
+class FakeIss:
+    """ISS stand-in: fixture securities, marketdata with changing prices, empty coupon schedules."""
+
+    def __init__(self, port: int):
+        self.securities = read_fixture('securities')
+        self.marketdata = json.loads(read_fixture('marketdata'))
+        self._lock = threading.Lock()
+        # job -> time the app requested its data, until the job run shows up in /metrics
+        self.pending: dict[str, float] = {}
+        self.server = ThreadingHTTPServer(('0.0.0.0', port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_port}/iss'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def _requested(self, job: str):
+        with self._lock:
+            self.pending.setdefault(job, time.monotonic())
+
+    def _next_marketdata(self) -> bytes:
+        with self._lock:
+            j = self.marketdata
+            for row in j['marketdata']['data']:
+                if row[2] is not None and random.random() < _changed_share:
+                    row[2] = round(row[2] * random.uniform(0.995, 1.005), 2)
+            j['dataversion']['data'][0][1] += 1
+            content = json.dumps(j).encode()
+        return content
+
+    def _handler(self):
+        iss = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if '/bondization/' in url.path:
+                    body = _empty_bondization
+                elif url.path.endswith('/markets/bonds/securities.json') and 'iss.only=securities' in url.query:
+                    iss._requested('update_securities')
+                    body = iss.securities
+                elif url.path.endswith('/markets/bonds/securities.json'):
+                    # the securities job loads marketdata as well, that's a part of its refresh
+                    if 'update_securities' not in iss.pending:
+                        iss._requested('update_marketdata')
+                    body = iss._next_marketdata()
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class RefreshMonitor:
+    """Turns pending ISS requests into (start, end) refresh windows when /metrics counts the job run."""
+
+    _count = re.compile(r'^bonds_job_duration_seconds_count\{job="(\w+)"} (\d+)$', re.MULTILINE)
+
+    def __init__(self, app_url: str, iss: FakeIss):
+        self.app_url = app_url
+        self.iss = iss
+        self.windows: list[tuple[float, float, str]] = []
+        self._counts: dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def job_counts(self) -> dict[str, int]:
+        text = requests.get(f'{self.app_url}/metrics', timeout=10).text
+        return {job: int(n) for job, n in self._count.findall(text)}
+
+    def start(self):
+        self._counts = self.job_counts()
+        # requests of runs finished before the counts above
+        with self.iss._lock:
+            self.iss.pending.clear()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(_metrics_poll):
+            try:
+                counts = self.job_counts()
+            except requests.RequestException:
+                continue
+            now = time.monotonic()
+            for job in _refresh_jobs:
+                if counts.get(job, 0) > self._counts.get(job, 0):
+                    with self.iss._lock:
+                        start = self.iss.pending.pop(job, None)
+                        # marketdata of the securities job requested just before the securities
+                        marketdata = self.iss.pending.get('update_marketdata')
+                        if job == 'update_securities' and start is not None and marketdata is not None \
+                                and marketdata > start - 1:
+                            del self.iss.pending['update_marketdata']
+                    if start is not None:
+                        self.windows.append((start, now, job))
+            self._counts = counts
+
+
+class DashClient:
+    """Requests a browser sends for the search and calc pages, built from /_dash-dependencies."""
+
+    def __init__(self, app_url: str):
+        self.app_url = app_url
+        deps = requests.get(f'{app_url}/_dash-dependencies', timeout=10).json()
+        self._deps = {d['output']: d for d in deps}
+
+    def _payload(self, output: str, inputs: list, state: list = ()) -> dict:
+        dep = self._deps[output]
+        outputs = [
+            {'id': o.split('.')[0], 'property': o.split('.')[1].split('@')[0]}
+            for o in output.strip('.').split('...')
+        ]
+        return {
+            'output': output,
+            'outputs': outputs if output.startswith('..') else outputs[0],
+            'inputs': [dict(i, value=v) for i, v in zip(dep['inputs'], inputs)],
+            'state': [dict(s, value=v) for s, v in zip(dep['state'], state)],
+            'changedPropIds': [f'{i["id"]}.{i["property"]}' for i in dep['inputs'][:1]],
+        }
+
+    def search(self, query: str) -> dict:
+        return self._payload('isin_search_records.data', [query])
+
+    def calc_layout(self, secid: str) -> dict:
+        return self._payload('.._pages_content.children..._pages_store.data..', [f'/calc/{secid}', ''])
+
+    def calc_chart(self, secid: str, days: int = 31) -> dict:
+        return self._payload('price_chart.figure', [days], [secid])
+
+
+class Samples:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (request, start, end, ok)
+        self.rows: list[tuple[str, float, float, bool]] = []
+
+    def add(self, rows: list):
+        with self._lock:
+            self.rows.extend(rows)
+
+
+def _timed(session: requests.Session, rows: list, name: str, method: str, url: str, **kwargs):
+    start = time.monotonic()
+    try:
+        r = session.request(method, url, timeout=60, **kwargs)
+        ok = r.status_code < 400
+    except requests.RequestException:
+        ok = False
+    rows.append((name, start, time.monotonic(), ok))
+
+
+def _user(client: DashClient, mix: list[tuple[str, float]], queries: list[str], secids: list[str],
+          deadline: float, think: float, samples: Samples, seed: int):
+    rnd = random.Random(seed)
+    update = f'{client.app_url}/_dash-update-component'
+    names, weights = zip(*mix)
+    with requests.Session() as session:
+        while time.monotonic() < deadline:
+            rows = []
+            if rnd.choices(names, weights)[0] == 'search':
+                _timed(session, rows, 'search', 'POST', update, json=client.search(rnd.choice(queries)))
+            else:
+                secid = rnd.choice(secids)
+                _timed(session, rows, 'calc_page', 'GET', f'{client.app_url}/calc/{secid}')
+                _timed(session, rows, 'calc_layout', 'POST', update, json=client.calc_layout(secid))
+                _timed(session, rows, 'calc_chart', 'POST', update, json=client.calc_chart(secid))
+            samples.add(rows)
+            if think:
+                time.sleep(rnd.expovariate(1 / think))
+
+
+def _fixture_terms() -> tuple[list[str], list[str]]:
+    """Search queries of 3 to 8 characters and secids of the fixture securities."""
+    j = json.loads(read_fixture('securities'))
+    columns = j['securities']['columns']
+    secid, isin, shortname = (columns.index(c) for c in ('SECID', 'ISIN', 'SHORTNAME'))
+    rows = j['securities']['data']
+    rnd = random.Random(0)
+    queries = []
+    for row in rnd.sample(rows, min(len(rows), 500)):
+        term = rnd.choice((row[secid], row[isin], row[shortname].lower()))
+        queries.append(term[:rnd.randint(3, 8)])
+    return queries, [row[secid] for row in rows]
+
+
+def _dockerfile_cmd() -> list[str]:
+    with open(_dockerfile) as f:
+        return next(json.loads(line[len('CMD'):]) for line in f if line.startswith('CMD'))
+
+
+def start_app(server: str, port: int, iss_url: str, marketdata_interval: int, workdir: str) -> subprocess.Popen:
+    if server == 'gunicorn':
+        cmd = _dockerfile_cmd()
+        cmd[cmd.index('-b') + 1] = f'127.0.0.1:{port}'
+        # gunicorn looks for its config in the working directory, which is a temporary one here
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(_src, 'gunicorn.conf.py')] + cmd[1:]
+    else:
+        cmd = [
+            sys.executable, '-c',
+            f'import app; app.init_app(); app.server.run(host="127.0.0.1", port={port}, threaded=True)',
+        ]
+    env = dict(
+        os.environ,
+        PYTHONPATH=_src,
+        MOEX_ISS_URL=iss_url,
+        BONDS_MARKETDATA_INTERVAL=str(marketdata_interval),
+        DASH_DEBUG_MODE='False',
+    )
+    # the app keeps bonds.db in the working directory
+    return subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(app_url: str, timeout: float, poll: float = 0.5):
+    """Until the app reports that it has bond data to serve."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{app_url}/ready', timeout=10).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(poll)
+    raise TimeoutError(f'app at {app_url} didn\'t load bonds within {timeout:.0f}s')
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def report(samples: Samples, windows: list[tuple[float, float, str]], start: float, end: float) -> dict:
+    # overlapping refreshes of both jobs are one window
+    windows_ = []
+    for s, e in sorted((max(s, start), min(e, end)) for s, e, _ in windows if e > start and s < end):
+        if windows_ and s <= windows_[-1][1]:
+            windows_[-1] = (windows_[-1][0], max(e, windows_[-1][1]))
+        else:
+            windows_.append((s, e))
+    windows = windows_
+    refresh_seconds = sum(e - s for s, e in windows)
+    starts = [s for s, _ in windows]
+
+    def during_refresh(s: float, e: float) -> bool:
+        # the last window starting before the request ends
+        i = bisect.bisect_left(starts, e) - 1
+        return i >= 0 and windows[i][1] > s
+
+    groups: dict[tuple[str, str], list] = {}
+    for name, s, e, ok in samples.rows:
+        if start <= s and e <= end:
+            phase = 'refresh' if during_refresh(s, e) else 'idle'
+            groups.setdefault((phase, name), []).append((e - s, ok))
+            groups.setdefault((phase, 'all'), []).append((e - s, ok))
+
+    seconds = {'idle': end - start - refresh_seconds, 'refresh': refresh_seconds}
+    res = {'refreshes': len(windows), 'refresh_seconds': round(refresh_seconds, 1), 'phases': {}}
+    for (phase, name), values in sorted(groups.items()):
+        latencies = sorted(v for v, _ in values)
+        res['phases'].setdefault(phase, {})[name] = {
+            'requests': len(values),
+            'errors': sum(not ok for _, ok in values),
+            'rps': round(len(values) / seconds[phase], 1) if seconds[phase] else None,
+            'p50_ms': round(_percentile(latencies, 0.5) * 1000, 1),
+            'p95_ms': round(_percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(_percentile(latencies, 0.99) * 1000, 1),
+        }
+    return res
+
+
+def _print_report(res: dict, users: int):
+    print(f'users: {users}, refreshes: {res["refreshes"]} ({res["refresh_seconds"]}s)')
+    print(f'{"phase":8} {"request":12} {"requests":>9} {"errors":>7} {"rps":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    for phase, requests_ in res['phases'].items():
+        for name, r in requests_.items():
+            print(
+                f'{phase:8} {name:12} {r["requests"]:>9} {r["errors"]:>7} {r["rps"] or "-":>8} '
+                f'{r["p50_ms"]:>8} {r["p95_ms"]:>8} {r["p99_ms"]:>8}'
+            )
+
+
+def _mix(value: str) -> list[tuple[str, float]]:
+    mix = [(name, float(weight)) for name, weight in (p.split('=') for p in value.split(','))]
+    if not {name for name, _ in mix} <= {'search', 'calc'}:
+        raise argparse.ArgumentTypeError('scenarios are search and calc')
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50, help='concurrent users, each sends one request at a time')
+    parser.add_argument('--seconds', type=float, default=180)
+    parser.add_argument('--warmup', type=float, default=10, help='seconds of load not counted in the results')
+    parser.add_argument('--think', type=float, default=0, help='mean pause of a user between scenarios, seconds')
+    parser.add_argument('--mix', type=_mix, default='search=3,calc=1', help='scenario weights')
+    parser.add_argument('--marketdata-interval', type=int, default=60, help='seconds between marketdata polls')
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default='gunicorn')
+    parser.add_argument('--port', type=int, default=8051)
+    parser.add_argument('--url', help='load an already running app instead of starting one')
+    parser.add_argument('--iss-port', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    iss = FakeIss(args.iss_port)
+    iss.start()
+    print(f'ISS stand-in at {iss.url}')
+    queries, secids = _fixture_terms()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = None
+        app_url = args.url
+        if app_url is None:
+            app = start_app(args.server, args.port, iss.url, args.marketdata_interval, workdir)
+            app_url = f'http://127.0.0.1:{args.port}'
+        monitor = RefreshMonitor(app_url.rstrip('/'), iss)
+        try:
+            wait_ready(monitor.app_url, 120)
+            monitor.start()
+            client = DashClient(monitor.app_url)
+            samples = Samples()
+            start = time.monotonic() + args.warmup
+            end = start + args.seconds
+            users = [
+                threading.Thread(
+                    target=_user, args=(client, args.mix, queries, secids, end, args.think, samples, i),
+                )
+                for i in range(args.users)
+            ]
+            for u in users:
+                u.start()
+            for u in users:
+                u.join()
+            monitor.stop()
+        finally:
+            if app is not None:
+                app.terminate()
+                app.wait()
+            iss.stop()
+
+    res = report(samples, monitor.windows, start, end)
+    _print_report(res, args.users)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(dict(res, users=args.users, seconds=args.seconds, mix=dict(args.mix)), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark of ISS securities payload decoding: the former per-row dict path
+(json + _to_dict + per-row date parsing) against the columnar parser.
+
+    python bench/parse_securities.py [--rows 3000] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from data import BasicBondInfo  # noqa: E402
+from data import moex  # noqa: E402
+from synthetic import synthetic_securities_payload  # noqa: E402
+
+
+def _legacy_to_dict(moex_json, columns: list[str]):
+    return [
+        {k : r[i] for i, k in enumerate(moex_json['columns']) if k in columns}
+                  for r in moex_json['data']
+    ]
+
+
+def _legacy_to_optional_date(date_str: str) -> date | None:
+    if date_str and date_str != '0000-00-00':
+        return date.fromisoformat(date_str)
+    else: return None
+
+
+def legacy_parse_moex_securities(content: bytes) -> list[BasicBondInfo]:
+    j = json.loads(content)
+    data = _legacy_to_dict(j['securities'], moex._securities_columns.split(sep=','))
+    return [
+        BasicBondInfo(
+            b['SHORTNAME'],
+            b['SECID'],
+            b['ISIN'],
+            _legacy_to_optional_date(b['MATDATE']),
+            b['COUPONPERCENT'],
+            b['LISTLEVEL'],
+            b['COUPONVALUE'] if b['COUPONVALUE'] != 0 else None,
+            date.fromisoformat(b['NEXTCOUPON']),
+            b['ACCRUEDINT'],
+            b['CURRENCYID'],
+            b['FACEUNIT'],
+            b['FACEVALUE'],
+            b['COUPONPERIOD'],
+            b['ISSUESIZE'],
+            _legacy_to_optional_date(b['OFFERDATE']),
+            float(b['PREVPRICE']) if b['PREVPRICE'] is not None else None,
+            b['REGNUMBER'],
+        )
+        for b in data
+        if (b['BOARDID'] != 'SPOB' and b['NEXTCOUPON'] != '0000-00-00')
+    ]
+
+
+def columnar_parse_moex_securities(content: bytes) -> list[BasicBondInfo]:
+    return moex.parse_moex_securities(moex._json_loads(content))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=3000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    content = json.dumps(synthetic_securities_payload(args.rows)).encode()
+    assert legacy_parse_moex_securities(content) == columnar_parse_moex_securities(content)
+
+    print(f'payload: {len(content) / 1024:.0f} KiB')
+    results = {}
+    for name, f in [('legacy', legacy_parse_moex_securities), ('columnar', columnar_parse_moex_securities)]:
+        results[name] = min(timeit.repeat(lambda: f(content), number=1, repeat=args.repeat)) * 1000
+        print(f'{name:>10}: {results[name]:.2f} ms')
+    print(f'speedup: {results["legacy"] / results["columnar"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
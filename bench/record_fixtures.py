@@ -0,0 +1,72 @@
+"""
+Record ISS payloads used by the benchmark suite into bench/fixtures.
+
+    python bench/record_fixtures.py              # download from ISS (or MOEX_ISS_URL)
+    python bench/record_fixtures.py --synthetic  # generate offline stand-ins of the same shape
+
+Files are gzipped raw response bodies, so parsing is benchmarked on real bytes.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from data import moex  # noqa: E402
+from synthetic import synthetic_securities_payload, synthetic_marketdata_payload  # noqa: E402
+
+fixtures_dir = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# name -> (ISS path, query)
+_payloads = {
+    'securities': (
+        'engines/stock/markets/bonds/securities.json',
+        f'{moex._moex_options}&iss.only=securities&securities.columns={moex._securities_columns}',
+    ),
+    'marketdata': (
+        'engines/stock/markets/bonds/securities.json',
+        f'{moex._moex_options}&iss.only=marketdata,dataversion&marketdata.columns=BOARDID,SECID,LAST',
+    ),
+}
+
+# synthetic fixtures are generated for a fixed date, so they are the same on every run
+_synthetic_date = date(2025, 10, 1)
+
+
+def fixture_path(name: str) -> str:
+    return os.path.join(fixtures_dir, f'{name}.json.gz')
+
+
+def read_fixture(name: str) -> bytes:
+    with gzip.open(fixture_path(name), 'rb') as f:
+        return f.read()
+
+
+def _write(name: str, content: bytes):
+    os.makedirs(fixtures_dir, exist_ok=True)
+    # mtime=0 keeps the file byte-identical between recordings of the same payload
+    with open(fixture_path(name), 'wb') as f, gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+        gz.write(content)
+    print(f'{name}: {len(content) / 1024:.0f} KiB -> {fixture_path(name)}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--synthetic', action='store_true')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        _write('securities', json.dumps(synthetic_securities_payload(today=_synthetic_date)).encode())
+        _write('marketdata', json.dumps(synthetic_marketdata_payload(today=_synthetic_date)).encode())
+        return
+    for name, (path, query) in _payloads.items():
+        r = moex.iss.session.get(f'{moex.iss.base_url}/{path}?{query}', timeout=moex.iss.timeout)
+        r.raise_for_status()
+        _write(name, r.content)
+
+
+if __name__ == '__main__':
+    main()
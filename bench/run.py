@@ -0,0 +1,178 @@
+"""
+Offline benchmark suite on the ISS payloads in bench/fixtures (synthetic unless re-recorded from ISS).
+Results are written to bench/results/<commit>.json and compared with the previous run.
+
+    python bench/run.py [--repeat 20] [--compare bench/results/<commit>.json] [--threshold 0.2]
+"""
+import argparse
+import glob
+import random
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+_src = os.path.join(os.path.dirname(__file__), '..', 'src')
+sys.path.insert(0, _src)
+# never reach the real ISS from benchmarks
+os.environ.setdefault('MOEX_ISS_URL', 'http://127.0.0.1:9/iss')
+
+import dash  # noqa: E402
+from dash._utils import to_json  # noqa: E402
+
+from data import batch, db, moex  # noqa: E402
+from data.moex import MoexMarketData, BondMarketData  # noqa: E402
+from record_fixtures import read_fixture, fixture_path  # noqa: E402
+
+dash.Dash(__name__, use_pages=True, pages_folder=os.path.join(_src, 'pages'))
+from pages import calc, search  # noqa: E402
+
+results_dir = os.path.join(os.path.dirname(__file__), 'results')
+
+_calc_scenarios = 100_000
+# against the synthetic fixtures: many matches (limited to 100) by shortname, by isin prefix and by a two-word query,
+# 10 and 1 by secid prefix, a query too short for FTS and a miss
+_search_queries = ['офз', 'RU000A0012', 'облиг 13', 'SU0136', 'SU01363', 'ру', 'нет такой облигации']
+
+
+def _timings(f, repeat: int, number: int = 1) -> dict[str, float]:
+    times = [t / number * 1000 for t in timeit.repeat(f, number=number, repeat=repeat)]
+    return {'min_ms': round(min(times), 4), 'median_ms': round(statistics.median(times), 4)}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+def _fixture_sha(name: str) -> str:
+    with open(fixture_path(name), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def run(repeat: int) -> dict[str, dict[str, float]]:
+    securities_content = read_fixture('securities')
+    marketdata_content = read_fixture('marketdata')
+    res = {}
+
+    res['parse_securities'] = _timings(
+        lambda: moex.parse_moex_securities(moex._json_loads(securities_content)), repeat)
+    res['parse_marketdata'] = _timings(
+        lambda: moex.parse_moex_marketdata(moex._json_loads(marketdata_content)), repeat)
+
+    bonds = moex.parse_moex_securities(moex._json_loads(securities_content))
+    marketdata = moex.parse_moex_marketdata(moex._json_loads(marketdata_content))
+    # same rows with every price changed, so each update below writes all of them
+    marketdata_changed = [
+        MoexMarketData(str(i), [BondMarketData(r.secid, r.last_price + i / 100) for r in marketdata.rows])
+        for i in range(repeat + 1)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db._db_name = os.path.join(tmp, 'bonds.db')
+        db.db_migrate()
+        res['db_bonds_update'] = _timings(lambda: db.moex_bonds_db_update(bonds), repeat)
+        updates = iter(marketdata_changed)
+        res['db_marketdata_update'] = _timings(lambda: db.moex_marketdata_db_update(next(updates)), repeat)
+        res['db_marketdata_update_unchanged'] = _timings(
+            lambda: db.moex_marketdata_db_update(marketdata_changed[-1]), repeat)
+        res['db_metrics_update'] = _timings(db.moex_bond_metrics_db_update, repeat)
+        db._db_mark_data_updated()
+
+        # uncached search paths: SQLite (FTS) and in-memory snapshot
+        for q in _search_queries:
+            res[f'search_db[{q}]'] = _timings(lambda: db._moex_bonds_search(q, 100, 'shortname'), repeat, 10)
+        res['snapshot_refresh'] = _timings(db.bonds_snapshot_refresh, repeat)
+        for q in _search_queries:
+            res[f'search_snapshot[{q}]'] = _timings(lambda: db._moex_bonds_search(q, 100, 'shortname'), repeat, 10)
+
+        secid = bonds[0].secid
+        res['calc_layout'] = _timings(lambda: to_json(calc.layout(secid)), repeat, 10)
+        found = db._moex_bonds_search('', 100, 'shortname')
+        res['search_render_100'] = _timings(
+            lambda: to_json({"bonds": [search._to_record(b) for b in found]}), repeat, 10)
+
+        # /api/calc: evaluation and JSON lines of a 100k scenario batch
+        r = random.Random(3)
+        scenarios = [
+            {'secid': r.choice(bonds).secid, 'buy_price': round(r.uniform(80, 105), 2)} if i % 2 else
+            {'secid': r.choice(bonds).secid, 'sell_date': '2027-06-30', 'sell_price': round(r.uniform(90, 110), 2)}
+            for i in range(_calc_scenarios)
+        ]
+        res['batch_calc_100k'] = _timings(lambda: batch.batch_calculate(scenarios), max(3, repeat // 4))
+        results = batch.batch_calculate(scenarios)
+        res['batch_calc_100k_json'] = _timings(
+            lambda: [results.iloc[i:i + 10_000].to_json(orient='records', lines=True) for i in range(0, len(results), 10_000)],
+            max(3, repeat // 4),
+        )
+        db.db_close_connection()
+    return res
+
+
+def _previous_result(current_path: str) -> str | None:
+    files = sorted(
+        (p for p in glob.glob(os.path.join(results_dir, '*.json')) if os.path.abspath(p) != os.path.abspath(current_path)),
+        key=os.path.getmtime,
+    )
+    return files[-1] if files else None
+
+
+def compare(current: dict, baseline_path: str, threshold: float) -> int:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f'\ncompared with {os.path.basename(baseline_path)} ({baseline["meta"]["commit"]}):')
+    regressions = 0
+    for name, t in current['results'].items():
+        old = baseline['results'].get(name)
+        if not old:
+            continue
+        ratio = t['median_ms'] / old['median_ms'] if old['median_ms'] else 1
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = '  <-- regression'
+            regressions += 1
+        print(f'{name:>40}: {old["median_ms"]:9.3f} -> {t["median_ms"]:9.3f} ms ({ratio:.2f}x){mark}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--compare', help='result file to compare with, the latest other one by default')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown reported as regression')
+    args = parser.parse_args()
+
+    current = {
+        'meta': {
+            'commit': _git_commit(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'fixtures': {name: _fixture_sha(name) for name in ('securities', 'marketdata')},
+        },
+        'results': run(args.repeat),
+    }
+    for name, t in current['results'].items():
+        print(f'{name:>40}: min {t["min_ms"]:9.3f} ms, median {t["median_ms"]:9.3f} ms')
+
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f'{current["meta"]["commit"]}.json')
+    with open(path, 'w') as f:
+        json.dump(current, f, indent=2, ensure_ascii=False)
+    print(f'\nwritten {path}')
+
+    baseline = args.compare or _previous_result(path)
+    if baseline and compare(current, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark of search result rendering on a 100-row result: the former server-built
+component tree (one ListGroupItem with ~25 components per bond) against plain records
+rendered clientside by assets/search.js. Reports build + JSON serialization time and payload size.
+
+    python bench/search_render.py [--rows 100] [--repeat 50]
+"""
+import argparse
+import os
+import sys
+import timeit
+from typing import Any
+
+_src = os.path.join(os.path.dirname(__file__), '..', 'src')
+sys.path.insert(0, _src)
+
+import dash  # noqa: E402
+import dash_bootstrap_components as dbc  # noqa: E402
+from dash import html  # noqa: E402
+from dash._utils import to_json  # noqa: E402
+
+from data import BasicBondInfo, currency_str, write_date, write_optional_date  # noqa: E402
+from data.calc import BondMetrics  # noqa: E402
+from synthetic import synthetic_bonds  # noqa: E402
+
+dash.Dash(__name__, use_pages=True, pages_folder=os.path.join(_src, 'pages'))
+from pages import search  # noqa: E402
+
+_perpetual_mat_date = html.Span("Бессрочно", className="text-danger")
+
+
+def legacy_get_calc_link(bond: BasicBondInfo):
+    if bond.coupon_percent is not None:
+        coupon_str = f'{bond.coupon_percent} %'
+        coupon_left_suffix = f'• {bond.coupon_value} {currency_str(bond.face_unit)}'
+    else:
+        coupon_str = "-"
+        coupon_left_suffix = ""
+
+    if bond.metrics is not None and bond.metrics.current_yield is not None:
+        cur_yield = f'{bond.metrics.current_yield} %'
+    else:
+        cur_yield = "-"
+
+    def col(children: Any):
+        return dbc.Col(children)
+    def auto_col(children: Any):
+        return dbc.Col(children, width="auto")
+
+    return dbc.ListGroupItem(
+        [
+            dbc.Row([
+                auto_col(html.H5(bond.shortname, className="card-title")),
+                dbc.Col(html.Small(bond.isin, className="text-muted"), className="p-0"),
+                auto_col(
+                    dbc.Badge(
+                        bond.list_level,
+                        pill=True,
+                        color="warning" if (int(bond.list_level) >= 3) else "success",
+                        className="me-1",
+                    ),
+                ),
+            ]),
+            dbc.Row([
+                col(html.Span("Погашение", className="text-muted")),
+                auto_col(write_optional_date(bond.mat_date) or _perpetual_mat_date)
+            ]),
+            dbc.Row([
+                col(html.Span("Выплата купона", className="text-muted")),
+                auto_col(write_date(bond.coupon_date))
+            ]),
+            dbc.Row([
+                col(html.Span(
+                    f'Купон {coupon_left_suffix}',
+                    className="text-muted")
+                ),
+                auto_col(coupon_str)
+            ]),
+            dbc.Row([
+                col(html.Span("Тек. доходность", className="text-muted")),
+                auto_col(html.B(cur_yield)),
+            ]),
+            dbc.Row([
+                col(html.Span("Цена", className="text-muted")),
+                auto_col(html.Span(
+                    bond.prev_price,
+                    className="text-danger" if ((bond.prev_price or 0) > 100) else ""
+                )),
+            ]),
+        ],
+        href=f"calc/{bond.secid}"
+    )
+
+
+def legacy_render(bonds: list[BasicBondInfo]) -> str:
+    return to_json([legacy_get_calc_link(b) for b in bonds])
+
+
+def records_render(bonds: list[BasicBondInfo]) -> str:
+    return to_json({"bonds": [search._to_record(b) for b in bonds]})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    bonds = [
+        b._replace(metrics=BondMetrics(b.prev_price, 10.5, b.mat_date, 100, 12.3, 12.1))
+        for b in synthetic_bonds(args.rows)
+    ]
+    results = {}
+    for name, f in [('components', legacy_render), ('records', records_render)]:
+        ms = min(timeit.repeat(lambda: f(bonds), number=1, repeat=args.repeat)) * 1000
+        size = len(f(bonds).encode())
+        results[name] = (ms, size)
+        print(f'{name:>10}: {ms:.2f} ms, {size / 1024:.1f} KiB')
+    print(
+        f'time: {results["components"][0] / results["records"][0]:.1f}x, '
+        f'payload: {results["components"][1] / results["records"][1]:.1f}x smaller'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Startup time of the app run the way the Dockerfile runs it, against the ISS stand-in of bench/load_test.py.
+
+    python bench/startup.py [--runs 5] [--server gunicorn] [--importtime 20]
+
+Reports the median time from starting the server to the first served page and to a 200 from /ready
+(bond data loaded), for a cold start with an empty DB and for a restart with the DB of the previous run,
+like a container with the DB on a volume. --importtime lists the slowest imports of the app module.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from load_test import FakeIss, start_app, wait_ready
+
+_src = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+# 'import time: self [us] | cumulative | <indent>package'
+_importtime_line = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_times(top: int) -> list[tuple[str, float]]:
+    """Cumulative seconds of the slowest imports of the app module, nested up to two levels deep."""
+    with tempfile.TemporaryDirectory() as workdir:
+        res = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import app'],
+            cwd=workdir, env=dict(os.environ, PYTHONPATH=_src), capture_output=True, text=True, check=True,
+        )
+    times = []
+    for line in res.stderr.splitlines():
+        m = _importtime_line.match(line)
+        if m and len(m.group(3)) <= 5:
+            times.append((m.group(3)[1:] + m.group(4), int(m.group(2)) / 1e6))
+    return sorted(times, key=lambda t: -t[1])[:top]
+
+
+def _start_once(server: str, port: int, iss: FakeIss, workdir: str) -> tuple[float, float]:
+    """Seconds to the first served page and to readiness."""
+    app_url = f'http://127.0.0.1:{port}'
+    start = time.monotonic()
+    app = start_app(server, port, iss.url, 0, workdir)
+    try:
+        while True:
+            try:
+                if requests.get(app_url, timeout=10).ok:
+                    break
+            except requests.ConnectionError:
+                if app.poll() is not None:
+                    raise RuntimeError(f'app exited with {app.returncode}')
+            time.sleep(0.01)
+        first_page = time.monotonic() - start
+        wait_ready(app_url, 120, poll=0.01)
+        return first_page, time.monotonic() - start
+    finally:
+        app.terminate()
+        app.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default='gunicorn')
+    parser.add_argument('--port', type=int, default=8052)
+    parser.add_argument('--importtime', type=int, default=0, help='number of the slowest imports to list')
+    args = parser.parse_args()
+
+    if args.importtime:
+        for name, seconds in import_times(args.importtime):
+            print(f'{seconds * 1000:8.1f} ms  {name}')
+        print()
+
+    iss = FakeIss(0)
+    iss.start()
+    try:
+        results = {'cold': [], 'restart': []}
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as workdir:
+                results['cold'].append(_start_once(args.server, args.port, iss, workdir))
+                results['restart'].append(_start_once(args.server, args.port, iss, workdir))
+    finally:
+        iss.stop()
+
+    print(f'{"start":8} {"first page s":>13} {"ready s":>8}')
+    for name, runs in results.items():
+        first_page, ready = zip(*runs)
+        print(f'{name:8} {statistics.median(first_page):>13.2f} {statistics.median(ready):>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import random
+from datetime import date, timedelta
+
+from data import BasicBondInfo
+from data.moex import BondMarketData
+
+
+def synthetic_bonds(n: int = 3000, seed: int = 1, today: date | None = None) -> list[BasicBondInfo]:
+    """Bond universe of roughly MOEX size and shape, for offline benchmarks."""
+    r = random.Random(seed)
+    today = today or date.today()
+    bonds = []
+    for i in range(n):
+        coupon = round(r.uniform(0, 25), 2) if r.random() > 0.1 else None
+        bonds.append(BasicBondInfo(
+            shortname=f'Облиг {i} ОФЗ{i % 50}',
+            secid=f'SU{i:05d}RMFS',
+            isin=f'RU000A{i:06d}',
+            mat_date=today + timedelta(days=r.randint(-30, 4000)) if r.random() > 0.02 else None,
+            coupon_percent=coupon,
+            list_level=r.randint(1, 3),
+            coupon_value=round(r.uniform(1, 100), 2) if coupon else None,
+            coupon_date=today + timedelta(days=r.randint(0, 180)),
+            nkd=round(r.uniform(0, 30), 2),
+            currency_id='SUR',
+            face_unit='SUR',
+            face_value=1000.0,
+            coupon_period=182,
+            issue_size=1_000_000,
+            offer_date=today + timedelta(days=r.randint(0, 800)) if r.random() < 0.2 else None,
+            prev_price=round(r.uniform(60, 110), 2) if r.random() > 0.05 else None,
+            reg_number=f'4-01-{i:05d}-A',
+        ))
+    return bonds
+
+
+def synthetic_marketdata(bonds: list[BasicBondInfo], seed: int = 2) -> list[BondMarketData]:
+    """Last prices for about 70% of the bonds, as during a trading session."""
+    r = random.Random(seed)
+    return [
+        BondMarketData(b.secid, round(r.uniform(60, 110), 2))
+        for b in bonds
+        if r.random() < 0.7
+    ]
+
+
+_securities_columns = [
+    'SECID', 'ISIN', 'SHORTNAME', 'STATUS', 'BOARDID', 'MATDATE', 'COUPONPERCENT', 'LISTLEVEL', 'COUPONVALUE',
+    'NEXTCOUPON', 'ACCRUEDINT', 'CURRENCYID', 'FACEUNIT', 'FACEVALUE', 'COUPONPERIOD', 'ISSUESIZE', 'OFFERDATE',
+    'PREVPRICE', 'REGNUMBER',
+]
+
+
+def _iso(d: date | None) -> str:
+    return d.isoformat() if d else '0000-00-00'
+
+
+def synthetic_securities_payload(n: int = 3000, seed: int = 1, today: date | None = None) -> dict:
+    """ISS compact JSON for securities.json?iss.only=securities, SPOB duplicates included."""
+    data = []
+    for i, b in enumerate(synthetic_bonds(n, seed, today)):
+        row = [
+            b.secid, b.isin, b.shortname, 'A', 'TQCB', _iso(b.mat_date), b.coupon_percent, b.list_level,
+            b.coupon_value or 0, _iso(b.coupon_date), b.nkd, b.currency_id, b.face_unit, b.face_value,
+            b.coupon_period, b.issue_size, b.offer_date.isoformat() if b.offer_date else None, b.prev_price,
+            b.reg_number,
+        ]
+        data.append(row)
+        if i % 10 == 0:
+            data.append(row[:4] + ['SPOB'] + row[5:])
+    return {'securities': {'columns': _securities_columns, 'data': data}}
+
+
+def synthetic_marketdata_payload(n: int = 3000, seed: int = 2, version: int = 1, today: date | None = None) -> dict:
+    """ISS compact JSON for securities.json?iss.only=marketdata,dataversion."""
+    today = today or date.today()
+    bonds = synthetic_bonds(n, today=today)
+    prices = {m.secid: m.last_price for m in synthetic_marketdata(bonds, seed)}
+    return {
+        'marketdata': {
+            'columns': ['BOARDID', 'SECID', 'LAST'],
+            'data': [['TQCB', b.secid, prices.get(b.secid)] for b in bonds],
+        },
+        'dataversion': {
+            'columns': ['data_version', 'seqnum', 'trade_date', 'trade_session_date'],
+            'data': [[version, 20250000 + seed, today.isoformat(), today.isoformat()]],
+        },
+    }
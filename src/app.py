@@ -1,24 +1,54 @@
 # -*- coding: utf-8 -*-
 import atexit
-from datetime import datetime
+import os
+from datetime import date, datetime, timedelta
 
 import dash
 from apscheduler.triggers.interval import IntervalTrigger
 from dash import Dash
 import dash_bootstrap_components as dbc
 import logging
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
 from apscheduler.schedulers.background import BackgroundScheduler
+from flask import Response, request
 
-from data import update_local_bonds_db, db_create_tables, update_local_db_marketdata
+from data import update_local_bonds_db, update_local_bond_schedules, db_migrate, update_local_db_marketdata, bonds_snapshot_sync, LeaderLock, \
+    metrics, moex_price_history_db_prune, price_hub, MarketHoursTrigger, batch_calculate, bonds_data_updated_at, bonds_data_loaded
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s %(message)s"
 )
+logger = logging.getLogger(__name__)
 
 app = Dash(external_stylesheets=[dbc.themes.BOOTSTRAP, dbc.icons.BOOTSTRAP], use_pages=True)
 server = app.server
-scheduler = BackgroundScheduler()
+scheduler = BackgroundScheduler(job_defaults={
+    # a run that is late because the previous one is still loading is merged into one, never run in parallel
+    'coalesce': True,
+    'max_instances': 1,
+    'misfire_grace_time': 60,
+})
+# seconds before the next run of a failing MOEX job, doubled with each failure in a row
+_backoff_min = 60
+_backoff_max = 3600
+_job_failures: dict[str, int] = {}
+# which process fetches data from MOEX:
+# - 'auto': the one holding the leader lock, others take over when it exits
+# - 'never': this process only reads data fetched by another process
+_fetcher_mode = os.environ.get('BONDS_FETCHER', 'auto')
+leader_lock = LeaderLock()
+# seconds between marketdata polls regardless of MOEX trading hours, f.e. for load tests (bench/load_test.py);
+# 0 polls by trading hours
+_marketdata_interval = int(os.environ.get('BONDS_MARKETDATA_INTERVAL', '0'))
+# seconds between keep-alive comments of idle live price streams, also how soon a gone client is noticed
+_live_keepalive = 25
+# live price streams of this process, each holds a gunicorn thread (~26 KB resident when idle) and connection
+# while open; gunicorn.conf.py sizes 'threads' and 'worker_connections' above it for pages, Dash callbacks and /ready
+_live_max_streams = int(os.environ.get('BONDS_LIVE_MAX_STREAMS', '1500'))
+# scenarios in one /api/calc request, and per streamed chunk of results
+_calc_max_scenarios = 200_000
+_calc_chunk = 10_000
 
 # dbc.Label(
 #     dcc.Link(
@@ -33,33 +63,196 @@ app.layout = dbc.Container([
     dash.page_container
 ])
 
-# TODO: schedule update_local_db_marketdata calls
-def init_app():
-    db_create_tables()
-    scheduler.start()
+
+@server.route('/metrics')
+def prometheus_metrics():
+    # metrics are per process: with several gunicorn workers each scrape sees one of them,
+    # fetch job metrics are only in the worker holding the leader lock
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+@server.route('/ready')
+def ready():
+    """
+    Readiness probe: 200 once this process has started its jobs and has bond data to serve, 503 before.
+    'data_updated_at' is the last complete MOEX load, it stays behind while ISS fails.
+    """
+    is_ready = scheduler.running and bonds_data_loaded()
+    updated_at = bonds_data_updated_at()
+    body = {
+        'ready': is_ready,
+        'data_updated_at': updated_at.isoformat() if updated_at else None,
+        'fetcher': leader_lock.is_held,
+    }
+    return body, 200 if is_ready else 503
+
+
+@server.route('/live/prices/<secid>')
+def live_prices(secid: str):
+    """
+    Server-sent events with new prices of one bond, consumed by live.js on the calc page.
+    503 when this process already serves _live_max_streams streams, the page then works without live prices.
+    """
+    subscription = price_hub.subscribe(secid, _live_max_streams)
+    if subscription is None:
+        metrics.live_streams_rejected.inc()
+        return 'too many live price streams', 503, {'Retry-After': '60'}
+
+    def stream():
+        yield 'retry: 10000\n\n'
+        while True:
+            price = subscription.wait(_live_keepalive)
+            yield f'data: {price}\n\n' if price is not None else ': keep-alive\n\n'
+
+    response = Response(
+        stream(),
+        mimetype='text/event-stream',
+        # no buffering in reverse proxies
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+    # also when the client is gone before the stream started, a generator that never ran has no cleanup
+    response.call_on_close(subscription.close)
+    return response
+
+
+@server.route('/api/calc', methods=['POST'])
+def api_calc():
+    """
+    Calc page results for a batch of scenarios: {"scenarios": [{"secid": ..., "buy_price": ..., ...}, ...]}.
+    Results are calculated and streamed as JSON lines a chunk of scenarios at a time, in the order of scenarios,
+    so the first lines go out before the last ones are calculated. See data/batch.py for the fields.
+    """
+    body = request.get_json(silent=True)
+    scenarios = body.get('scenarios') if isinstance(body, dict) else None
+    if not isinstance(scenarios, list) or not all(isinstance(s, dict) for s in scenarios):
+        return {'error': 'expected {"scenarios": [{...}, ...]}'}, 400
+    if len(scenarios) > _calc_max_scenarios:
+        return {'error': f'no more than {_calc_max_scenarios} scenarios per request'}, 400
+    # one date for all chunks, also past midnight
+    today = date.today()
+
+    def stream():
+        for start in range(0, len(scenarios), _calc_chunk):
+            # timed per chunk, without the time the client takes to read the previous one
+            with metrics.page_seconds.time(page='api_calc'):
+                results = batch_calculate(scenarios[start:start + _calc_chunk], today)
+                chunk = results.to_json(orient='records', lines=True).rstrip('\n') + '\n'
+            yield chunk
+
+    return Response(stream(), mimetype='application/x-ndjson')
+
+
+# ids of the jobs of start_fetch_jobs
+_fetch_jobs = ('update_securities', 'update_marketdata', 'update_schedules', 'prune_price_history')
+
+
+def start_fetch_jobs():
+    db_migrate()
+    # serve what is already in the DB while the jobs below catch up
+    bonds_snapshot_sync()
 
     # schedule jobs
+    # poll often while MOEX trades, rarely when it is closed
     update_securities_job = scheduler.add_job(
         func=update_local_bonds_db,
-        trigger=IntervalTrigger(hours=1),
+        trigger=MarketHoursTrigger(timedelta(hours=1), timedelta(hours=6), jitter=60),
+        id='update_securities',
         replace_existing=True,
     )
-    update_marketdata_job = scheduler.add_job(
+    scheduler.add_job(
         func=update_local_db_marketdata,
-        trigger=IntervalTrigger(minutes=1),
+        trigger=(
+            IntervalTrigger(seconds=_marketdata_interval) if _marketdata_interval
+            else MarketHoursTrigger(timedelta(minutes=1), timedelta(minutes=30), jitter=5)
+        ),
+        id='update_marketdata',
+        replace_existing=True,
+    )
+    # a batch of missing or outdated coupon schedules at a time
+    scheduler.add_job(
+        func=update_local_bond_schedules,
+        trigger=IntervalTrigger(minutes=5),
+        id='update_schedules',
+        replace_existing=True,
+    )
+    # price bars past their retention
+    scheduler.add_job(
+        func=moex_price_history_db_prune,
+        trigger=IntervalTrigger(days=1),
+        id='prune_price_history',
         replace_existing=True,
     )
 
-    # execute jobs now
+    # execute now, securities job loads marketdata as well
     update_securities_job.modify(next_run_time=datetime.now())
-    update_marketdata_job.modify(next_run_time=datetime.now())
 
-    # shut down the scheduler when exiting the app
-    atexit.register(lambda: scheduler.shutdown())
 
+def back_off(event):
+    """Postpone the next run of a failed job, the delay grows with the number of failures in a row."""
+    if event.job_id == 'coordinate':
+        return
+    if event.exception is None:
+        _job_failures.pop(event.job_id, None)
+        return
+    failures = _job_failures[event.job_id] = _job_failures.get(event.job_id, 0) + 1
+    job = scheduler.get_job(event.job_id)
+    if job is None or job.next_run_time is None:
+        return
+    delay = min(_backoff_min * 2 ** (failures - 1), _backoff_max)
+    next_run_time = datetime.now(job.next_run_time.tzinfo) + timedelta(seconds=delay)
+    if next_run_time > job.next_run_time:
+        job.modify(next_run_time=next_run_time)
+        logger.warning(f'Job {event.job_id} failed {failures} time(s) in a row, next run at {next_run_time}')
+
+
+def stop_fetch_jobs():
+    for job_id in _fetch_jobs:
+        if scheduler.get_job(job_id) is not None:
+            scheduler.remove_job(job_id)
+
+
+def coordinate():
+    """Become the fetcher if nobody else is, otherwise pick up data committed by the fetcher."""
+    if _fetcher_mode != 'never' and not leader_lock.is_held and leader_lock.try_acquire():
+        logger.info(f'Process {os.getpid()} is the MOEX data fetcher now')
+        try:
+            start_fetch_jobs()
+        except Exception as e:
+            # a leader without jobs would never fetch, so hand the lock over: this process or another one
+            # tries again on the next coordinate run
+            logger.exception(f'Failed to start MOEX fetch jobs, releasing the fetcher lock: {e}')
+            stop_fetch_jobs()
+            leader_lock.release()
+    if not leader_lock.is_held:
+        bonds_snapshot_sync()
+
+
+def shutdown():
+    scheduler.shutdown()
+    leader_lock.release()
+
+
+def init_app():
+    """
+    Start background jobs of this process. Not done on import, so gunicorn can import the app once
+    before forking workers (threads don't survive fork), see gunicorn.conf.py.
+    """
+    if scheduler.running:
+        return
+    scheduler.add_listener(back_off, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+    scheduler.start()
+    scheduler.add_job(
+        func=coordinate,
+        trigger=IntervalTrigger(seconds=10),
+        id='coordinate',
+        next_run_time=datetime.now(),
+        replace_existing=True,
+    )
 
-init_app()
+    # shut down the scheduler and hand over fetching when exiting the app
+    atexit.register(shutdown)
 
 
 if __name__ == '__main__':
+    init_app()
     app.run(debug=True, host='0.0.0.0', port=8050)
@@ -24,20 +24,8 @@ window.dash_clientside = Object.assign({}, window.dash_clientside, {
             var commission_fixed = commission
             if (_till_maturity) commission_fixed = commission / 2.0
 
-            const income = (
-                // ((C13 * C8) - (C10 * C8))
-                (sell_price * par_value - buy_price * par_value) +
-                // ((C8*C7)/365)*РАЗНДАТ(C11;C14;"d")
-                par_value * coupon / 365 * days -
-                // (((C13 * C8) + (C10 * C8)) * C5)
-                (sell_price * par_value + buy_price * par_value) * commission_fixed
-            ) * (1 - tax)
-
-            const profitability = (
-                // =((C16 / (РАЗНДАТ(C11;C14;"d"))) * 365) / (C10 * C8 + ((C13 * C8) + (C10 * C8)) * C5)
-                (income * 365 / days) /
-                (buy_price * par_value + (sell_price + buy_price) * par_value * commission_fixed) * 100
-            )
+            const income = _income(tax, coupon, par_value, days, buy_price, sell_price, commission_fixed)
+            const profitability = _profitability(income, par_value, days, buy_price, sell_price, commission_fixed)
 
             const current_yield = coupon / buy_price * 100 * (1 - tax)
 
@@ -47,10 +35,113 @@ window.dash_clientside = Object.assign({}, window.dash_clientside, {
                 format_number(income.toFixed(2)),
                 format_number(days)
             ]
+        },
+
+        // yield or income over buy prices x sell dates, the whole grid in one pass over typed arrays
+        grid: function(
+            show,
+            value,
+            commission,
+            tax,
+            coupon,
+            par_value,
+            buy_date,
+            buy_price,
+            sell_date,
+            sell_price,
+            till_maturity,
+        ) {
+            // figure and style of the graph, hidden instead of empty axes
+            const hidden = [{}, {height: _grid_height, display: "none"}]
+            if (!show) return hidden
+            const _buy_date = Date.parse(buy_date)
+            const _sell_date = Date.parse(sell_date)
+            if (isNaN(_buy_date) || isNaN(_sell_date) || !(buy_price > 0)) return hidden
+
+            commission = commission / 100.0
+            tax = tax / 100.0
+            coupon = coupon / 100.0
+            sell_price = sell_price / 100.0
+            const commission_fixed = till_maturity === "maturity" ? commission / 2.0 : commission
+
+            const max_days = Math.max(_days_between(_buy_date, _sell_date), 1)
+            const days = _linspace(1, max_days, Math.min(_grid_size, max_days)).map(Math.round)
+            const prices = _linspace(
+                buy_price * (1 - _grid_price_range / 100), buy_price * (1 + _grid_price_range / 100), _grid_size
+            )
+            const z = new Array(prices.length)
+            const all = new Float64Array(prices.length * days.length)
+            for (let i = 0; i < prices.length; i++) {
+                const row = new Float64Array(days.length)
+                const price = prices[i] / 100.0
+                for (let j = 0; j < days.length; j++) {
+                    const income = _income(tax, coupon, par_value, days[j], price, sell_price, commission_fixed)
+                    row[j] = value === "income"
+                        ? income
+                        : _profitability(income, par_value, days[j], price, sell_price, commission_fixed)
+                }
+                z[i] = Array.from(row, v => Math.round(v * 100) / 100)
+                all.set(row, i * days.length)
+            }
+            // annualized yield of selling in a few days is huge, colors span 5-95 percentiles instead
+            all.sort()
+            const finite = all.filter(isFinite)
+            // f.e. no par value or tax entered, no color scale to build
+            if (finite.length === 0) return hidden
+            const zmin = finite[Math.floor(finite.length * 0.05)]
+            const zmax = finite[Math.floor(finite.length * 0.95)]
+            const oneDay = 24 * 60 * 60 * 1000
+            return [{
+                data: [{
+                    type: "heatmap",
+                    x: Array.from(days, d => new Date(_buy_date + d * oneDay).toISOString().slice(0, 10)),
+                    y: Array.from(prices, p => Math.round(p * 100) / 100),
+                    z: z,
+                    zmin: Math.min(zmin, 0),
+                    zmax: Math.max(zmax, 0),
+                    zmid: 0,
+                    colorscale: "RdYlGn",
+                    hovertemplate: "продажа %{x}<br>покупка %{y}<br>%{z}<extra></extra>",
+                }],
+                layout: {
+                    margin: {l: 50, r: 10, t: 10, b: 40},
+                    xaxis: {title: {text: "дата продажи"}},
+                    yaxis: {title: {text: "цена покупки"}},
+                },
+            }, {height: _grid_height}]
         }
     }
 });
 
+function _income(tax, coupon, par_value, days, buy_price, sell_price, commission_fixed) {
+    return (
+        // ((C13 * C8) - (C10 * C8))
+        (sell_price * par_value - buy_price * par_value) +
+        // ((C8*C7)/365)*РАЗНДАТ(C11;C14;"d")
+        par_value * coupon / 365 * days -
+        // (((C13 * C8) + (C10 * C8)) * C5)
+        (sell_price * par_value + buy_price * par_value) * commission_fixed
+    ) * (1 - tax)
+}
+
+function _profitability(income, par_value, days, buy_price, sell_price, commission_fixed) {
+    // =((C16 / (РАЗНДАТ(C11;C14;"d"))) * 365) / (C10 * C8 + ((C13 * C8) + (C10 * C8)) * C5)
+    return (income * 365 / days) /
+        (buy_price * par_value + (sell_price + buy_price) * par_value * commission_fixed) * 100
+}
+
+// points on each axis of the scenario grid, and the buy price range around the entered one, %
+const _grid_size = 101
+const _grid_price_range = 10
+// same as in scenario_grid of pages/calc.py
+const _grid_height = "400px"
+
+function _linspace(from, to, n) {
+    const res = new Float64Array(n)
+    for (let i = 0; i < n; i++) res[i] = n > 1 ? from + (to - from) * i / (n - 1) : from
+    return res
+}
+
 function _days_between(start, end) {
     const oneDay = 24 * 60 * 60 * 1000;
     return Math.round(Math.abs((end - start) / oneDay));
@@ -0,0 +1,32 @@
+// separate namespace: calc.js replaces the whole 'clientside' one
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    live: {
+        // listens to price pushes of the bond shown on the calc page, see /live/prices in app.py
+        subscribe: function(secid, buy_price) {
+            if (window._live_prices) {
+                window._live_prices.close()
+                window._live_prices = null
+            }
+            if (!secid) return null
+            const source = new EventSource(`/live/prices/${encodeURIComponent(secid)}`)
+            let shown_price = buy_price
+            source.onmessage = function(e) {
+                const input = document.getElementById('buy_price')
+                if (!input) {
+                    // left the calc page
+                    source.close()
+                    return
+                }
+                // keep a price typed in by the user; a bond shown without a price takes the first push
+                // unless something was typed in meanwhile
+                const typed = shown_price == null ? input.value !== '' && input.value != null
+                    : parseFloat(input.value) !== parseFloat(shown_price)
+                if (typed) return
+                shown_price = parseFloat(e.data)
+                window.dash_clientside.set_props('buy_price', {value: shown_price})
+            }
+            window._live_prices = source
+            return secid
+        }
+    }
+});
@@ -0,0 +1,63 @@
+// separate namespace: calc.js replaces the whole 'clientside' one
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    search: {
+        // builds the same list items as the server used to, from plain search records
+        render: function(result) {
+            if (!result) return null
+            if (result.message) {
+                return _html('Span', result.message, result.error ? {className: 'text-danger'} : {})
+            }
+            return result.bonds.map(_search_item)
+        }
+    }
+});
+
+function _component(namespace, type, children, props) {
+    return {
+        namespace: namespace,
+        type: type,
+        props: Object.assign({children: children}, props || {}),
+    }
+}
+
+function _html(type, children, props) {
+    return _component('dash_html_components', type, children, props)
+}
+
+function _dbc(type, children, props) {
+    return _component('dash_bootstrap_components', type, children, props)
+}
+
+function _col(children) {
+    return _dbc('Col', children)
+}
+
+function _auto_col(children) {
+    return _dbc('Col', children, {width: 'auto'})
+}
+
+function _muted_row(label, value) {
+    return _dbc('Row', [
+        _col(_html('Span', label, {className: 'text-muted'})),
+        _auto_col(value),
+    ])
+}
+
+function _search_item(bond) {
+    return _dbc('ListGroupItem', [
+        _dbc('Row', [
+            _auto_col(_html('H5', bond.shortname, {className: 'card-title'})),
+            _dbc('Col', _html('Small', bond.isin, {className: 'text-muted'}), {className: 'p-0'}),
+            _auto_col(_dbc('Badge', bond.list_level, {
+                pill: true,
+                color: bond.list_level >= 3 ? 'warning' : 'success',
+                className: 'me-1',
+            })),
+        ]),
+        _muted_row('Погашение', bond.mat_date || _html('Span', 'Бессрочно', {className: 'text-danger'})),
+        _muted_row('Выплата купона', bond.coupon_date),
+        _muted_row(`Купон ${bond.coupon_suffix}`, bond.coupon),
+        _muted_row('Тек. доходность', _html('B', bond.cur_yield)),
+        _muted_row('Цена', _html('Span', bond.price, {className: (bond.price || 0) > 100 ? 'text-danger' : ''})),
+    ], {href: `calc/${bond.secid}`})
+}
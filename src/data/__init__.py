@@ -1,16 +1,45 @@
-from .db import update_local_db_marketdata, update_local_bonds_db, moex_bonds_db_search, moex_bonds_db_get, db_create_tables
+from .db import update_local_db_marketdata, update_local_bonds_db, update_local_bond_schedules, moex_bonds_db_search, moex_bonds_db_get, db_migrate, bonds_snapshot_sync, bonds_data_updated_at, bonds_data_loaded, db_cache_stats, \
+    moex_bonds_db_screen, ScreenerFilter, ScreenerPage, moex_price_history_db_get, moex_price_history_db_prune, PriceBar
+from . import metrics
+from .batch import batch_calculate
+from .leader import LeaderLock
+from .live import price_hub
+from .market_hours import MarketHoursTrigger, is_trading_time
 from .moex import BasicBondInfo
-from .util import write_date, write_optional_date, parse_date, currency_str
+from .portfolio import portfolio_evaluate, parse_holdings, Holding, PortfolioResult
+from .util import write_date, write_datetime, write_optional_date, parse_date, currency_str
 
 __all__ = [
     "BasicBondInfo",
+    "Holding",
+    "LeaderLock",
+    "MarketHoursTrigger",
+    "PortfolioResult",
+    "PriceBar",
+    "ScreenerFilter",
+    "ScreenerPage",
+    "batch_calculate",
+    "bonds_data_loaded",
+    "bonds_data_updated_at",
+    "bonds_snapshot_sync",
     "currency_str",
-    "db_create_tables",
+    "db_cache_stats",
+    "db_migrate",
+    "is_trading_time",
+    "metrics",
     "update_local_db_marketdata",
     "update_local_bonds_db",
+    "update_local_bond_schedules",
     "moex_bonds_db_get",
+    "moex_bonds_db_screen",
     "moex_bonds_db_search",
+    "moex_price_history_db_get",
+    "moex_price_history_db_prune",
     "parse_date",
+    "parse_holdings",
+    "portfolio_evaluate",
+    "price_hub",
     "write_date",
+    "write_datetime",
     "write_optional_date",
 ]
@@ -0,0 +1,142 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype, is_bool_dtype, is_numeric_dtype
+
+from .calc import calculate
+from .db import moex_bonds_db_get
+
+# Batch version of the calc page: scenarios are dicts with the calc page fields,
+# missing ones are filled the way the page fills them for the bond.
+
+_scenario_columns = [
+    'secid', 'commission', 'tax', 'coupon', 'par_value',
+    'buy_date', 'buy_price', 'sell_type', 'sell_date', 'sell_price',
+]
+_numeric_columns = ['commission', 'tax', 'coupon', 'par_value', 'buy_price', 'sell_price']
+_date_columns = ['buy_date', 'sell_date']
+# calc page input defaults
+_default_commission = 0.05
+_default_tax = 13.0
+# values of the calc page 'sell_type' radio
+_sell_types = ('maturity', 'offer', 'sell')
+result_columns = ['secid', 'profitability', 'current_yield', 'income', 'days', 'error']
+
+
+def _bond_columns(secids) -> pd.DataFrame:
+    rows = []
+    for secid in secids:
+        bond = moex_bonds_db_get(secid)
+        if bond is not None:
+            rows.append((
+                secid, bond.face_value, bond.coupon_percent, bond.prev_price, bond.mat_date, bond.offer_date, True,
+            ))
+    # same dtypes with no bond found or no price of any, the numbers fill scenario values
+    return pd.DataFrame.from_records(rows, columns=[
+        'secid', 'bond_par_value', 'bond_coupon', 'bond_price', 'bond_mat_date', 'bond_offer_date', 'bond_found',
+    ]).astype({'secid': object, 'bond_par_value': np.float64, 'bond_coupon': np.float64, 'bond_price': np.float64})
+
+
+def _finite(a: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    # f.e. buying and selling on the same day gives infinite profitability
+    return np.where(valid & np.isfinite(a), np.round(a, 2), np.nan)
+
+
+def _dates(s: pd.Series, date_format: str | None = None) -> pd.Series:
+    return pd.to_datetime(s, errors='coerce', format=date_format).astype('datetime64[s]')
+
+
+def _add_error(error: pd.Series, mask: pd.Series, message: str):
+    # the first error of a scenario is reported
+    if mask.any():
+        error[mask & error.isna()] = message
+
+
+def _validate(df: pd.DataFrame) -> pd.Series:
+    """
+    Errors of scenarios with missing secid or fields of wrong types. Wrong values are replaced with None in 'df'
+    and dates are parsed, so the rest of the calculation sees only strings, numbers and dates.
+    """
+    error = pd.Series(None, index=df.index, dtype=object)
+    _add_error(error, df['secid'].isna(), 'secid required')
+    for c in _scenario_columns:
+        values = df[c]
+        if c in _numeric_columns and is_numeric_dtype(values) and not is_bool_dtype(values):
+            # numbers and missing values only, the usual case
+            continue
+        given = values.notna()
+        if not given.any():
+            continue
+        # JSON also gives lists, dicts and booleans, strings only are checked without a look at every value
+        is_str = given if infer_dtype(values, skipna=True) == 'string' else values.map(type) == str
+        if c in _numeric_columns:
+            ok = values.map(type).isin((int, float, str))
+            wrong = ~ok | pd.to_numeric(values.where(ok), errors='coerce').isna()
+            message = f'{c} must be a number'
+        elif c in _date_columns:
+            # parsed once here, the calculation takes the dates as they are
+            # one format for all rows, a guessed one would depend on the first row of the chunk
+            values = _dates(values.where(is_str), '%Y-%m-%d')
+            ok = values.notna()
+            wrong = ~ok
+            message = f'{c} must be a date as YYYY-MM-DD'
+        elif c == 'sell_type':
+            ok = is_str
+            wrong = ~values.where(ok).isin(_sell_types)
+            message = f'sell_type must be one of {", ".join(_sell_types)}'
+        else:
+            ok = is_str
+            wrong = ~ok
+            message = f'{c} must be a string'
+        _add_error(error, given & wrong, message)
+        df[c] = values.where(given & ok, None)
+    return error
+
+
+def batch_calculate(scenarios: list[dict], today: date | None = None) -> pd.DataFrame:
+    """
+    Evaluate calc page results for many scenarios at once, one result row per scenario in the same order.
+    Values that can't be calculated are NaN, 'error' explains rows that are wrong as a whole,
+    f.e. a missing secid or a field of a wrong type.
+    """
+    today = today or date.today()
+    df = pd.DataFrame.from_records(scenarios, columns=_scenario_columns)
+    error = _validate(df)
+    df = df.merge(_bond_columns(df['secid'].dropna().unique()), on='secid', how='left')
+
+    num = {c: pd.to_numeric(df[c], errors='coerce') for c in _numeric_columns}
+    buy_date = _dates(df['buy_date']).fillna(pd.Timestamp(today))
+    sell_date = _dates(df['sell_date'])
+    # the page starts with 'offer' if there is one, a given sell date means selling before redemption
+    sell_type = df['sell_type'].where(
+        df['sell_type'].notna(),
+        np.where(sell_date.notna(), 'sell', np.where(df['bond_offer_date'].notna(), 'offer', 'maturity')),
+    )
+    redemption_date = _dates(df['bond_offer_date'].where(sell_type == 'offer', df['bond_mat_date']))
+    is_sell = sell_type == 'sell'
+    # given values win over the ones of the bond
+    sell_date = sell_date.fillna(redemption_date.where(~is_sell, buy_date + pd.Timedelta(days=1)))
+
+    res = calculate(
+        num['commission'].fillna(_default_commission).values,
+        num['tax'].fillna(_default_tax).values,
+        num['coupon'].fillna(df['bond_coupon']).values,
+        num['par_value'].fillna(df['bond_par_value']).values,
+        buy_date.values,
+        num['buy_price'].fillna(df['bond_price']).values,
+        sell_date.values,
+        num['sell_price'].where(is_sell | num['sell_price'].notna(), 100.0).values,
+        (sell_type == 'maturity').values,
+    )
+
+    _add_error(error, df['secid'].notna() & df['bond_found'].isna(), 'bond not found')
+    valid = error.isna().values
+    return pd.DataFrame({
+        'secid': df['secid'],
+        'profitability': _finite(res.profitability, valid),
+        'current_yield': _finite(np.broadcast_to(res.current_yield, len(df)), valid),
+        'income': _finite(res.income, valid),
+        'days': pd.array(np.where(valid, res.days, np.nan), dtype='Int64'),
+        'error': error,
+    }, columns=result_columns)
@@ -0,0 +1,280 @@
+from datetime import date
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+# Vectorized port of window.dash_clientside.clientside.calculate (assets/calc.js).
+# All arguments may be scalars or array-likes, they are broadcast against each other.
+# Percent values (commission, tax, coupon, prices) are passed as on the calc page, e.g. 13 for 13%.
+
+
+class CalcResult(NamedTuple):
+    profitability: np.ndarray
+    current_yield: np.ndarray
+    income: np.ndarray
+    days: np.ndarray
+
+
+class BondMetrics(NamedTuple):
+    # ifnull(last_price, prev_price), % of face value
+    price: float | None
+    # coupon / price, before tax
+    current_yield: float | None
+    # offer date if there is one, otherwise maturity date
+    redemption_date: date | None
+    days_to_redemption: int | None
+    # calc.js 'profitability' for buying today at price and holding till redemption at 100,
+    # before tax and commission
+    yield_to_redemption: float | None
+    # effective yield to redemption date from the real coupon/amortization schedule, see schedule_ytm
+    ytm: float | None
+
+
+_nat_days = np.datetime64('NaT', 'D').astype(np.int64)
+
+
+def _to_days(v) -> np.ndarray:
+    """Convert dates (date, ISO string, datetime64 or array-like of those) to int64 days since epoch."""
+    a = np.asarray(v)
+    if not np.issubdtype(a.dtype, np.datetime64):
+        a = pd.to_datetime(a.ravel()).values.reshape(a.shape)
+    return a.astype('datetime64[D]').astype(np.int64)
+
+
+def calculate(
+        commission,
+        tax,
+        coupon,
+        par_value,
+        buy_date,
+        buy_price,
+        sell_date,
+        sell_price,
+        till_maturity,
+) -> CalcResult:
+    commission = np.asarray(commission, dtype=np.float64) / 100.0
+    tax = np.asarray(tax, dtype=np.float64) / 100.0
+    coupon = np.asarray(coupon, dtype=np.float64) / 100.0
+    par_value = np.asarray(par_value, dtype=np.float64)
+    buy_price = np.asarray(buy_price, dtype=np.float64) / 100.0
+    sell_price = np.asarray(sell_price, dtype=np.float64) / 100.0
+    till_maturity = np.asarray(till_maturity, dtype=bool)
+
+    sell_days = _to_days(sell_date)
+    buy_days = _to_days(buy_date)
+    days = np.abs(sell_days - buy_days).astype(np.float64)
+    # NaT, f.e. maturity of a perpetual bond
+    days = np.where((sell_days == _nat_days) | (buy_days == _nat_days), np.nan, days)
+    commission_fixed = np.where(till_maturity, commission / 2.0, commission)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        income = (
+            (sell_price * par_value - buy_price * par_value) +
+            par_value * coupon / 365 * days -
+            (sell_price * par_value + buy_price * par_value) * commission_fixed
+        ) * (1 - tax)
+
+        profitability = (
+            (income * 365 / days) /
+            (buy_price * par_value + (sell_price + buy_price) * par_value * commission_fixed) * 100
+        )
+
+        current_yield = coupon / buy_price * 100 * (1 - tax)
+
+    return CalcResult(profitability, current_yield, income, days)
+
+
+def solve_ytm(
+        price: np.ndarray,
+        times: np.ndarray,
+        amounts: np.ndarray,
+        max_iter: int = 100,
+        tol: float = 1e-10,
+) -> np.ndarray:
+    """
+    Effective annual yields y solving sum(amounts / (1 + y) ** times) = price for all bonds at once.
+    price: (n,) dirty price, times: (n, m) years till each cash flow, amounts: (n, m) cash flows,
+    padded with zero amounts. Newton steps are safeguarded by bisection, so the root stays bracketed.
+    NaN where there is no root in (-0.99, 10).
+    """
+    price = np.asarray(price, dtype=np.float64)
+    lo = np.full(len(price), -0.99)
+    hi = np.full(len(price), 10.0)
+
+    def pv(y):
+        with np.errstate(over='ignore', invalid='ignore'):
+            discount = (1 + y)[:, None] ** -times
+            value = (amounts * discount).sum(axis=1) - price
+            derivative = -(times * amounts * discount).sum(axis=1) / (1 + y)
+        return value, derivative
+
+    # pv is decreasing in y for positive cash flows
+    valid = (pv(lo)[0] > 0) & (pv(hi)[0] < 0) & (price > 0)
+    y = np.where(valid, 0.1, np.nan)
+    for _ in range(max_iter):
+        value, derivative = pv(y)
+        lo = np.where(value > 0, y, lo)
+        hi = np.where(value > 0, hi, y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = y - value / derivative
+        inside = (newton > lo) & (newton < hi)
+        y_next = np.where(inside, newton, (lo + hi) / 2)
+        converged = ~(np.abs(y_next - y) > tol)
+        y = np.where(valid, y_next, np.nan)
+        if converged.all():
+            break
+    return y
+
+
+def schedule_flows(bonds: pd.DataFrame, cashflows: pd.DataFrame, today: date) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Future cash flows of each row of 'bonds' till its redemption date, as rows: pos (row number), date,
+    kind ('C' - coupon, 'A' - amortization or redemption), value per bond. Also a mask of bonds with a schedule.
+    'bonds' columns: secid, face_value, coupon_value, redemption_date, offer_date.
+    'cashflows' columns: secid, date, kind, value - BondCashflow rows of bonds with a loaded schedule.
+    """
+    n = len(bonds)
+    position = pd.Series(np.arange(n), index=bonds['secid'].to_numpy())
+    cf = cashflows[cashflows['secid'].isin(position.index)].copy()
+    cf['pos'] = position.loc[cf['secid']].to_numpy()
+    cf['date'] = pd.to_datetime(cf['date'])
+    cf = cf[cf['date'] > pd.Timestamp(today)].sort_values(['pos', 'date'], kind='stable')
+
+    redemption = pd.to_datetime(bonds['redemption_date']).to_numpy()
+    offer = pd.to_datetime(bonds['offer_date']).to_numpy()
+    face_value = pd.to_numeric(bonds['face_value'], errors='coerce').to_numpy(dtype=np.float64)
+    cf = cf[cf['date'].to_numpy() <= redemption[cf['pos'].to_numpy()]]
+
+    # unknown future coupons (floaters) are assumed equal to the last known one, or to the current coupon
+    coupons = cf[cf['kind'] == 'C'].copy()
+    coupons['value'] = coupons.groupby('pos')['value'].ffill()
+    current_coupon = pd.to_numeric(bonds['coupon_value'], errors='coerce').to_numpy(dtype=np.float64)
+    coupons['value'] = coupons['value'].fillna(pd.Series(current_coupon[coupons['pos'].to_numpy()], index=coupons.index))
+    amortizations = cf[cf['kind'] == 'A']
+
+    # what is left of face value at redemption date is paid back: at offer price if there is an offer,
+    # at maturity ISS amortizations usually contain the whole redemption already
+    amortized = np.bincount(amortizations['pos'], weights=amortizations['value'].fillna(0), minlength=n)
+    offers = cf[cf['kind'] == 'O']
+    offer_price = np.full(n, 100.0)
+    offer_price[offers['pos'].to_numpy()] = offers['value'].fillna(100).to_numpy()
+    outstanding = face_value - amortized
+    redeem = pd.DataFrame({
+        'pos': np.arange(n),
+        'date': redemption,
+        'kind': 'A',
+        'value': np.where(pd.notna(offer), offer_price / 100, 1.0) * outstanding,
+    })
+    redeem = redeem[(redeem['value'] > 0.005) & pd.notna(redeem['date'])]
+
+    # built from arrays: pd.concat warns about empty parts, and most bonds have no amortizations
+    parts = (coupons, amortizations, redeem)
+    flows = pd.DataFrame({
+        'pos': np.concatenate([p['pos'].to_numpy(dtype=np.int64) for p in parts]),
+        'date': np.concatenate([p['date'].to_numpy(dtype='datetime64[ns]') for p in parts]),
+        'kind': np.concatenate([p['kind'].to_numpy(dtype=object) for p in parts]),
+        'value': np.concatenate([pd.to_numeric(p['value']).to_numpy(dtype=np.float64) for p in parts]),
+    }).dropna()
+    has_schedule = np.zeros(n, dtype=bool)
+    has_schedule[cf['pos'].unique()] = True
+    flows = flows[has_schedule[flows['pos'].to_numpy()]].sort_values(['pos', 'date'], kind='stable')
+    return flows.reset_index(drop=True), has_schedule
+
+
+def flow_matrix(flows: pd.DataFrame, n: int, today: date) -> tuple[np.ndarray, np.ndarray]:
+    """(n, m) years till each cash flow and amounts, padded with zero amounts, see solve_ytm."""
+    column = flows.groupby('pos').cumcount().to_numpy()
+    m = int(column.max()) + 1 if len(flows) else 1
+    times = np.zeros((n, m))
+    amounts = np.zeros((n, m))
+    rows = flows['pos'].to_numpy()
+    times[rows, column] = (flows['date'] - pd.Timestamp(today)).dt.days.to_numpy() / 365
+    amounts[rows, column] = flows['value'].to_numpy()
+    return times, amounts
+
+
+def duration(times: np.ndarray, amounts: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Macaulay duration in years of cash flows discounted at effective annual yields y, arrays as in solve_ytm."""
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        pv = amounts * (1 + y)[:, None] ** -times
+        return (times * pv).sum(axis=1) / pv.sum(axis=1)
+
+
+def dirty_price(bonds: pd.DataFrame) -> np.ndarray:
+    """Price with accrued interest per bond in face currency, NaN if NKD is in another currency."""
+    price = pd.to_numeric(bonds['price'], errors='coerce').to_numpy(dtype=np.float64)
+    face_value = pd.to_numeric(bonds['face_value'], errors='coerce').to_numpy(dtype=np.float64)
+    nkd = pd.to_numeric(bonds['nkd'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    # NKD of bonds settled in another currency than face value is not comparable with cash flows
+    same_currency = (bonds['currency_id'] == bonds['face_unit']).to_numpy()
+    return np.where(same_currency, price / 100 * face_value + nkd, np.nan)
+
+
+def schedule_ytm(bonds: pd.DataFrame, cashflows: pd.DataFrame, today: date) -> np.ndarray:
+    """
+    Effective yield to redemption date in % for each row of 'bonds', NaN if it can't be computed.
+    'bonds' columns: secid, price, face_value, nkd, coupon_value, currency_id, face_unit, redemption_date, offer_date.
+    'cashflows' columns: secid, date, kind, value - BondCashflow rows of bonds with a loaded schedule.
+    """
+    flows, has_schedule = schedule_flows(bonds, cashflows, today)
+    times, amounts = flow_matrix(flows, len(bonds), today)
+    price = np.where(has_schedule, dirty_price(bonds), np.nan)
+    return np.round(solve_ytm(price, times, amounts) * 100, 2)
+
+
+def _nan_to_none(v: float) -> float | None:
+    return None if np.isnan(v) else float(v)
+
+
+def bond_metrics(bonds: pd.DataFrame, cashflows: pd.DataFrame, today: date) -> list[tuple[str, BondMetrics]]:
+    """
+    Compute BondMetrics for the whole universe at once.
+    'bonds' must have columns: secid, coupon_percent, coupon_value, face_value, nkd, currency_id, face_unit,
+    mat_date, offer_date, price. 'cashflows' - see schedule_ytm.
+    """
+    price = pd.to_numeric(bonds['price'], errors='coerce').to_numpy(dtype=np.float64)
+    coupon = pd.to_numeric(bonds['coupon_percent'], errors='coerce').to_numpy(dtype=np.float64)
+    par_value = pd.to_numeric(bonds['face_value'], errors='coerce').to_numpy(dtype=np.float64)
+    redemption = pd.to_datetime(bonds['offer_date'].fillna(bonds['mat_date']), errors='coerce')
+
+    has_redemption = redemption.notna().to_numpy()
+    days = np.where(has_redemption, _to_days(redemption.values) - _to_days(np.datetime64(today, 'D')), -1)
+    # bonds redeemed today or earlier are still listed for a while, yield is meaningless for them
+    valid = has_redemption & (days > 0)
+
+    price = np.where(price > 0, price, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        current_yield = np.round(coupon / price * 100, 2)
+    res = calculate(
+        commission=0,
+        tax=0,
+        coupon=np.nan_to_num(coupon),
+        par_value=par_value,
+        buy_date=np.datetime64(today, 'D'),
+        buy_price=price,
+        sell_date=redemption.values,
+        sell_price=100,
+        till_maturity=True,
+    )
+    yield_to_redemption = np.round(np.where(valid, res.profitability, np.nan), 2)
+    ytm = schedule_ytm(
+        bonds.assign(price=price, redemption_date=redemption.where(pd.Series(valid, index=bonds.index))),
+        cashflows,
+        today,
+    )
+
+    return [
+        (
+            secid,
+            BondMetrics(
+                _nan_to_none(price[i]),
+                _nan_to_none(current_yield[i]),
+                redemption.iat[i].date() if has_redemption[i] else None,
+                int(days[i]) if has_redemption[i] else None,
+                _nan_to_none(yield_to_redemption[i]),
+                _nan_to_none(ytm[i]),
+            )
+        )
+        for i, secid in enumerate(bonds['secid'])
+    ]
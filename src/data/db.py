@@ -1,14 +1,33 @@
 import datetime
+import os
 import sqlite3
 import logging
+import threading
+import time
 from sqlite3 import Connection
+from typing import NamedTuple
 
-from .moex import BasicBondInfo, load_moex_marketdata, load_moex_securities, BondMarketData
+import pandas as pd
+
+from . import metrics
+from .calc import BondMetrics, bond_metrics
+from .moex import BasicBondInfo, load_moex_marketdata, load_moex_securities, MoexMarketData, BondMarketData, BondSchedule, \
+    load_moex_bondization, fetch_concurrently
+from .cache import VersionedLruCache
+from .live import price_hub
+from .snapshot import BondSnapshot
 
 # Useful docs:
 # - https://pradyunsg-cpython-lutra-testing.readthedocs.io/en/latest/library/sqlite3.html#sqlite3-adapter-converter-recipes
 
-_db_name = 'bonds.db'
+# f.e. on a volume, so a restarted container serves the previous data while loading fresh one
+_db_name = os.environ.get('BONDS_DB', 'bonds.db')
+# seconds to wait for the write lock instead of failing with 'database is locked'
+_db_busy_timeout = 10.0
+# number of prepared statements kept per connection
+_db_cached_statements = 256
+# in-memory bonds snapshot is not used if it gets bigger than this
+_snapshot_max_bytes = int(os.environ.get('BONDS_SNAPSHOT_MAX_MB', '64')) * 1024 * 1024
 logger = logging.getLogger(__name__)
 
 # configure database
@@ -24,8 +43,42 @@ sqlite3.register_adapter(datetime.date, _adapt_date_iso)
 sqlite3.register_converter("date", _convert_date_iso)
 # end of configure database
 
+_db_local = threading.local()
+
+
+def _db_open() -> Connection:
+    con = sqlite3.connect(
+        _db_name,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        timeout=_db_busy_timeout,
+        cached_statements=_db_cached_statements,
+    )
+    # WAL lets readers proceed while the scheduler thread commits a refresh
+    con.execute('PRAGMA journal_mode=WAL')
+    con.execute('PRAGMA synchronous=NORMAL')
+    return con
+
+
 def _db_connection() -> Connection:
-    return sqlite3.connect(_db_name, detect_types=sqlite3.PARSE_DECLTYPES)
+    """
+    Connection of the current thread, opened on first use and reused afterwards.
+    Connections inherited from a parent process (gunicorn fork) are not reused.
+    """
+    con = getattr(_db_local, 'con', None)
+    if con is None or _db_local.pid != os.getpid() or _db_local.name != _db_name:
+        con = _db_open()
+        _db_local.con = con
+        _db_local.pid = os.getpid()
+        _db_local.name = _db_name
+    return con
+
+
+def db_close_connection():
+    """Close connection of the current thread, if any."""
+    con = getattr(_db_local, 'con', None)
+    if con is not None and _db_local.pid == os.getpid():
+        con.close()
+    _db_local.con = None
 
 
 def _db_create_moex_marketdata_table(con: Connection):
@@ -38,13 +91,33 @@ def _db_create_moex_marketdata_table(con: Connection):
     ''')
 
 
-def _db_create_moex_bonds_table(con: Connection):
-    con.execute('''DROP TABLE IF EXISTS moex_bonds''')
+def _db_create_moex_sync_state_table(con: Connection):
+    # last seen state of MOEX data, f.e. ISS dataversion of marketdata
+    con.execute('''DROP TABLE IF EXISTS moex_sync_state''')
     con.execute('''
-        CREATE TABLE IF NOT EXISTS moex_bonds(
+        CREATE TABLE moex_sync_state(
+            name  TEXT NOT NULL PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+
+def _db_get_sync_state(con: Connection, name: str) -> str | None:
+    row = con.execute('SELECT value FROM moex_sync_state WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else None
+
+
+def _db_set_sync_state(con: Connection, name: str, value: str | None):
+    con.execute('INSERT OR REPLACE INTO moex_sync_state VALUES (?, ?)', (name, value))
+
+
+def _db_create_moex_bonds_table(con: Connection, table: str = 'moex_bonds'):
+    con.execute(f'''DROP TABLE IF EXISTS {table}''')
+    con.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table}(
             shortname_lc TEXT NOT NULL,
             shortname TEXT NOT NULL,
-            secid TEXT NOT NULL,
+            secid TEXT NOT NULL PRIMARY KEY,
             isin TEXT NOT NULL,
             mat_date date,
             coupon_percent REAL,
@@ -64,97 +137,865 @@ def _db_create_moex_bonds_table(con: Connection):
     ''')
 
 
+def _db_create_moex_bonds_fts_table(con: Connection, table: str = 'moex_bonds_fts'):
+    # trigram index for substring search, contentless: rowid points to moex_bonds.rowid
+    con.execute(f'''DROP TABLE IF EXISTS {table}''')
+    con.execute(f'''
+        CREATE VIRTUAL TABLE {table} USING fts5(
+            shortname, isin, secid, reg_number,
+            content='',
+            tokenize='trigram'
+        )
+    ''')
+
+
+def _db_create_moex_bond_metrics_table(con: Connection, table: str = 'moex_bond_metrics'):
+    con.execute(f'''DROP TABLE IF EXISTS {table}''')
+    con.execute(f'''
+        CREATE TABLE {table}(
+            secid               TEXT NOT NULL PRIMARY KEY,
+            price               REAL,
+            current_yield       REAL,
+            redemption_date     date,
+            days_to_redemption  INTEGER,
+            yield_to_redemption REAL,
+            ytm                 REAL
+        )
+    ''')
+
+
+def _db_create_moex_bond_schedule_tables(con: Connection):
+    # ISS bondization: coupons, amortizations and offers, see BondCashflow
+    con.execute('''
+        CREATE TABLE IF NOT EXISTS moex_bond_cashflows(
+            secid TEXT NOT NULL,
+            date  date NOT NULL,
+            kind  TEXT NOT NULL,
+            value REAL,
+            PRIMARY KEY (secid, date, kind)
+        ) WITHOUT ROWID
+    ''')
+    con.execute('''
+        CREATE TABLE IF NOT EXISTS moex_bond_schedules(
+            secid      TEXT NOT NULL PRIMARY KEY,
+            fetched_at date NOT NULL
+        )
+    ''')
+
+
+def _db_create_moex_price_bars_table(con: Connection):
+    # OHLC bars of last_price changes, see _db_record_prices. Timestamps are unix seconds of the bar start,
+    # prices are integers in _price_scale units: close as is, open/high/low as (mostly small) differences to it
+    con.execute('''
+        CREATE TABLE IF NOT EXISTS moex_price_bars(
+            secid  TEXT NOT NULL,
+            period INTEGER NOT NULL,
+            ts     INTEGER NOT NULL,
+            close  INTEGER NOT NULL,
+            open_d INTEGER NOT NULL,
+            high_d INTEGER NOT NULL,
+            low_d  INTEGER NOT NULL,
+            PRIMARY KEY (secid, period, ts)
+        ) WITHOUT ROWID
+    ''')
+    # for retention
+    con.execute('CREATE INDEX IF NOT EXISTS moex_price_bars_period_ts ON moex_price_bars(period, ts)')
+
+
+def _db_add_column(con: Connection, table: str, column: str, decl: str):
+    columns = [r[1] for r in con.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        con.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+
+# sortable columns, indexed together with secid for keyset pagination
+_moex_bonds_index_columns = ('shortname_lc', 'coupon_percent', 'mat_date', 'list_level', 'face_unit')
+_moex_bond_metrics_index_columns = ('price', 'current_yield', 'days_to_redemption', 'yield_to_redemption', 'ytm')
+
+
+def _db_create_moex_bonds_indexes(con: Connection):
+    # created on the live table only: index names can't be changed by a table rename
+    for column in _moex_bonds_index_columns:
+        con.execute(f'CREATE INDEX IF NOT EXISTS moex_bonds_{column} ON moex_bonds({column}, secid)')
+
+
+def _db_create_moex_bond_metrics_indexes(con: Connection):
+    # created on the live table only: index names can't be changed by a table rename
+    for column in _moex_bond_metrics_index_columns:
+        con.execute(f'CREATE INDEX IF NOT EXISTS moex_bond_metrics_{column} ON moex_bond_metrics({column}, secid)')
+
+
+_staging_suffix = '_staging'
+
+
+def _db_swap_tables(con: Connection, tables: list[str], after_swap=None):
+    """
+    Replace live tables with their fully loaded staging copies in one short transaction.
+    Readers see either the old or the new data, never an empty or partially loaded table.
+    """
+    with metrics.db_write_seconds.time(operation=f'swap_{tables[0]}'), con:
+        con.execute('BEGIN IMMEDIATE')
+        for table in tables:
+            con.execute(f'DROP TABLE IF EXISTS {table}')
+            con.execute(f'ALTER TABLE {table}{_staging_suffix} RENAME TO {table}')
+        if after_swap:
+            after_swap(con)
+
+
 def moex_bonds_db_update(bonds: list[BasicBondInfo]):
+    if not bonds:
+        logger.warning('No bonds to update moex_bonds table with, keeping current data')
+        return
     con = _db_connection()
     try:
-        with con:
-            con.execute("DELETE FROM moex_bonds")
-            for b in bonds:
-                con.execute('''
-                        INSERT INTO moex_bonds
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''',
-                   (b.shortname.casefold(),) + tuple(b)
-               )
+        staging = 'moex_bonds' + _staging_suffix
+        fts_staging = 'moex_bonds_fts' + _staging_suffix
+        _db_create_moex_bonds_table(con, staging)
+        _db_create_moex_bonds_fts_table(con, fts_staging)
+        with metrics.db_write_seconds.time(operation='load_moex_bonds'), con:
+            con.executemany(f'''
+                    INSERT OR REPLACE INTO {staging}
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''',
+                [(b.shortname.casefold(),) + tuple(b)[:-1] for b in bonds]
+            )
+            con.execute(f'''
+                INSERT INTO {fts_staging}(rowid, shortname, isin, secid, reg_number)
+                SELECT rowid, shortname, isin, secid, reg_number FROM {staging}
+            ''')
+        _db_swap_tables(con, ['moex_bonds', 'moex_bonds_fts'], _db_create_moex_bonds_indexes)
+        metrics.db_rows.set(len(bonds), table='moex_bonds')
         logger.info(f'Updated {len(bonds)} records in moex_bonds table')
     except Exception as e:
+        metrics.db_errors.inc(operation='update_moex_bonds')
         logger.error(f"Failed to update moex_bonds table:\n{e}")
-    finally:
-        con.close()
 
 
-def moex_bonds_db_search(query: str, limit: int = 100) -> list[BasicBondInfo]:
-    con = _db_connection()
+# allowed values of 'order_by' in moex_bonds_db_search
+_search_order = {
+    'shortname': 'shortname_lc',
+    'current_yield': 'current_yield DESC NULLS LAST, shortname_lc',
+    'yield_to_redemption': 'yield_to_redemption DESC NULLS LAST, shortname_lc',
+    'days_to_redemption': 'days_to_redemption NULLS LAST, shortname_lc',
+    'ytm': 'ytm DESC NULLS LAST, shortname_lc',
+}
+
+
+def _to_bond_info(row) -> BasicBondInfo:
+    return BasicBondInfo(*row[:17], BondMetrics(*row[17:]))
+
+
+_bond_select = '''
+    SELECT
+        shortname, moex_bonds.secid, isin, mat_date, coupon_percent,
+        list_level, coupon_value, coupon_date, nkd, currency_id,
+        face_unit, face_value, coupon_period, issue_size, offer_date,
+        ifnull(last_price, prev_price) as price,
+        reg_number,
+        moex_bond_metrics.price, current_yield, redemption_date,
+        days_to_redemption, yield_to_redemption, ytm
+    FROM moex_bonds
+    LEFT JOIN moex_marketdata ON moex_bonds.secid = moex_marketdata.secid
+    LEFT JOIN moex_bond_metrics ON moex_bonds.secid = moex_bond_metrics.secid
+'''
+
+# trigram index can't match strings shorter than 3 characters
+_fts_min_query_len = 3
+
+
+def _fts_phrase(query: str) -> str:
+    """Quote query as an FTS5 string, so it is matched as an exact substring."""
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _moex_bonds_search(query: str, limit: int, order_by: str) -> list[BasicBondInfo]:
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot.search(query, limit, order_by)
+    if len(query) >= _fts_min_query_len:
+        where = 'moex_bonds.rowid IN (SELECT rowid FROM moex_bonds_fts WHERE moex_bonds_fts MATCH ?)'
+        params = (_fts_phrase(query), limit)
+    else:
+        where = '(shortname_lc like ? or isin like ? or moex_bonds.secid = ?)'
+        params = (f'%{query.casefold()}%', f'%{query.upper()}%', query, limit)
+    bonds = _db_connection().execute(f'''
+            {_bond_select}
+            WHERE {where}
+            ORDER BY {_search_order[order_by]}
+            LIMIT ?
+        ''',
+        params
+    ).fetchall()
+    return [_to_bond_info(b) for b in bonds]
+
+
+def _moex_bonds_get(secid: str) -> BasicBondInfo | None:
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot.get(secid)
+    bond = _db_connection().execute(f'''
+            {_bond_select}
+            WHERE moex_bonds.secid = ?
+        ''',
+        (secid,)
+    ).fetchone()
+    return _to_bond_info(bond) if bond else None
+
+
+# results are cached until the next bonds_snapshot_refresh, search is case-insensitive
+search_cache = VersionedLruCache('search', maxsize=1024)
+get_cache = VersionedLruCache('get', maxsize=4096)
+
+
+def moex_bonds_db_search(query: str, limit: int = 100, order_by: str = 'shortname') -> list[BasicBondInfo]:
     try:
-        bonds = con.execute('''
-                SELECT
-                    shortname, moex_bonds.secid, isin, mat_date, coupon_percent,
-                    list_level, coupon_value, coupon_date, nkd, currency_id,
-                    face_unit, face_value, coupon_period, issue_size, offer_date,
-                    ifnull(last_price, prev_price) as price,
-                    reg_number
-                FROM moex_bonds
-                LEFT JOIN moex_marketdata ON moex_bonds.secid = moex_marketdata.secid
-                WHERE (shortname_lc like ? or isin like ? or moex_bonds.secid = ?)
-                ORDER BY shortname_lc
-                LIMIT ?
-            ''',
-            (f'%{query.casefold()}%', f'%{query.upper()}%', query, limit)
-        ).fetchall()
-        bonds = [BasicBondInfo(*b) for b in bonds]
-        return bonds
+        with metrics.query_seconds.time(operation='search'):
+            bonds = search_cache.get(
+                _data_generation,
+                (query.casefold(), limit, order_by),
+                lambda: _moex_bonds_search(query, limit, order_by),
+            )
+        return list(bonds)
     except Exception as e:
+        metrics.db_errors.inc(operation='search')
         logger.error(f"DB search failed. Query: {query}\nError:\n{e}")
         return []
-    finally:
-        con.close()
 
 def moex_bonds_db_get(secid: str) -> BasicBondInfo | None:
-    bonds = moex_bonds_db_search(secid, limit=1)
-    if len(bonds) == 1:
-        return bonds[0]
-    else:
+    try:
+        with metrics.query_seconds.time(operation='get'):
+            return get_cache.get(_data_generation, secid, lambda: _moex_bonds_get(secid))
+    except Exception as e:
+        metrics.db_errors.inc(operation='get')
+        logger.error(f"DB get failed. secid: {secid}\nError:\n{e}")
         return None
 
 
-def moex_marketdata_db_update(rows: list[BondMarketData]):
-    con = _db_connection()
+def db_cache_stats() -> dict[str, dict[str, int]]:
+    """Hit/miss counters of search and get result caches."""
+    return {c.name: c.stats() for c in (search_cache, get_cache)}
+
+
+def _cache_metric(stat: str):
+    return lambda: {(name,): s[stat] for name, s in db_cache_stats().items()}
+
+
+metrics.CallbackGauge('bonds_cache_hits_total', 'Result cache hits.', ('cache',), _cache_metric('hits'), 'counter')
+metrics.CallbackGauge('bonds_cache_misses_total', 'Result cache misses.', ('cache',), _cache_metric('misses'), 'counter')
+metrics.CallbackGauge('bonds_cache_entries', 'Entries in result cache.', ('cache',), _cache_metric('size'))
+metrics.CallbackGauge('bonds_live_subscribers', 'Open live price streams.', (), lambda: {(): price_hub.subscribers()})
+
+
+class ScreenerFilter(NamedTuple):
+    list_levels: tuple[int, ...] = ()
+    # MOEX FACEUNIT
+    currencies: tuple[str, ...] = ()
+    mat_date_from: datetime.date | None = None
+    mat_date_till: datetime.date | None = None
+    coupon_min: float | None = None
+    coupon_max: float | None = None
+    # BondMetrics.ytm
+    ytm_min: float | None = None
+    ytm_max: float | None = None
+
+
+class ScreenerPage(NamedTuple):
+    bonds: list[BasicBondInfo]
+    # pass as 'after' to get the next page, None if this is the last one
+    cursor: tuple | None
+
+
+# screener sort key -> indexed column, rows without a value come last, ordered by secid
+_screener_order = {
+    'shortname': 'moex_bonds.shortname_lc',
+    'coupon_percent': 'moex_bonds.coupon_percent',
+    'mat_date': 'moex_bonds.mat_date',
+    'price': 'moex_bond_metrics.price',
+    'current_yield': 'moex_bond_metrics.current_yield',
+    'yield_to_redemption': 'moex_bond_metrics.yield_to_redemption',
+    'ytm': 'moex_bond_metrics.ytm',
+    'days_to_redemption': 'moex_bond_metrics.days_to_redemption',
+}
+
+
+def _screener_sort_value(bond: BasicBondInfo, order_by: str):
+    if order_by == 'shortname':
+        return bond.shortname.casefold()
+    if order_by in ('coupon_percent', 'mat_date'):
+        v = getattr(bond, order_by)
+    else:
+        v = getattr(bond.metrics, order_by) if bond.metrics else None
+    return v.isoformat() if isinstance(v, datetime.date) else v
+
+
+def _screener_filter(f: ScreenerFilter, column: str) -> tuple[list[str], list]:
+    # unary '+' keeps SQLite off the indexes of filtered columns: walking the sort column index in order
+    # and skipping rows that don't match stops after one page, instead of sorting every matching row
+    def c(name: str) -> str:
+        return name if name == column else '+' + name
+
+    where = []
+    params = []
+    if f.list_levels:
+        where.append(f'{c("moex_bonds.list_level")} IN ({", ".join("?" * len(f.list_levels))})')
+        params.extend(f.list_levels)
+    if f.currencies:
+        where.append(f'{c("moex_bonds.face_unit")} IN ({", ".join("?" * len(f.currencies))})')
+        params.extend(f.currencies)
+    for name, op, value in (
+            ('moex_bonds.mat_date', '>=', f.mat_date_from),
+            ('moex_bonds.mat_date', '<=', f.mat_date_till),
+            ('moex_bonds.coupon_percent', '>=', f.coupon_min),
+            ('moex_bonds.coupon_percent', '<=', f.coupon_max),
+            ('moex_bond_metrics.ytm', '>=', f.ytm_min),
+            ('moex_bond_metrics.ytm', '<=', f.ytm_max),
+    ):
+        if value is not None:
+            where.append(f'{c(name)} {op} ?')
+            params.append(value)
+    return where, params
+
+
+def moex_bonds_db_screen(
+        f: ScreenerFilter,
+        order_by: str = 'ytm',
+        descending: bool = True,
+        after: tuple | None = None,
+        limit: int = 50,
+) -> ScreenerPage:
+    """
+    Filter the whole bond universe and return one page sorted by 'order_by'.
+    Pages are keyset-based: 'after' is the cursor of the previous page, (sort value, secid) of its last row.
+    Bonds without a sort value follow the others (sort value None in the cursor), f.e. no YTM before
+    the schedules job has loaded their coupons.
+    """
+    column = _screener_order[order_by]
+    secid = column.split('.')[0] + '.secid'
+    where, params = _screener_filter(f, column)
+    direction = 'DESC' if descending else 'ASC'
+    compare = '<' if descending else '>'
+    # (condition, params, order) of rows with a sort value, then of rows without one
+    parts = []
+    if after is None or after[0] is not None:
+        keyset = ([f'({column}, {secid}) {compare} (?, ?)'], list(after)) if after is not None else ([], [])
+        parts.append((
+            [f'{column} IS NOT NULL'] + keyset[0], keyset[1], f'{column} {direction}, {secid} {direction}',
+        ))
+    keyset = ([f'moex_bonds.secid {compare} ?'], [after[1]]) if after is not None and after[0] is None else ([], [])
+    parts.append(([f'{column} IS NULL'] + keyset[0], keyset[1], f'moex_bonds.secid {direction}'))
+    rows = []
     try:
-        with con:
-            con.execute("DELETE FROM moex_marketdata")
-            for r in rows:
-                con.execute('''
-                        INSERT OR REPLACE INTO moex_marketdata
-                        VALUES(?, ?)
+        with metrics.query_seconds.time(operation='screen'):
+            for conditions, keyset_params, order in parts:
+                rows += _db_connection().execute(f'''
+                        {_bond_select}
+                        WHERE {' AND '.join(conditions + where)}
+                        ORDER BY {order}
+                        LIMIT ?
                     ''',
-                    tuple(r)
-                )
-        logger.info(f'Updated {len(rows)} record(s) in moex_marketdata table')
+                    keyset_params + params + [limit - len(rows)]
+                ).fetchall()
+                if len(rows) == limit:
+                    break
+    except Exception as e:
+        metrics.db_errors.inc(operation='screen')
+        logger.error(f"DB screener query failed. Filter: {f}\nError:\n{e}")
+        return ScreenerPage([], None)
+    bonds = [_to_bond_info(r) for r in rows]
+    cursor = (_screener_sort_value(bonds[-1], order_by), bonds[-1].secid) if len(bonds) == limit else None
+    return ScreenerPage(bonds, cursor)
+
+
+def moex_marketdata_db_update(data: MoexMarketData) -> int:
+    """
+    Apply marketdata to moex_marketdata table, writing only rows that changed since the last update.
+    Nothing is written if ISS dataversion is the same as last time.
+    Returns number of changed (inserted, updated or deleted) rows.
+    """
+    con = _db_connection()
+    try:
+        if data.data_version is not None and data.data_version == _db_get_sync_state(con, 'marketdata_version'):
+            logger.info(f'moex_marketdata is up to date, dataversion {data.data_version}')
+            return 0
+        current = dict(con.execute('SELECT secid, last_price FROM moex_marketdata').fetchall())
+        changed = [r for r in data.rows if current.get(r.secid) != r.last_price]
+        new_secids = {r.secid for r in data.rows}
+        removed = [(secid,) for secid in current if secid not in new_secids]
+        with metrics.db_write_seconds.time(operation='update_moex_marketdata'), con:
+            con.executemany('''
+                    INSERT OR REPLACE INTO moex_marketdata
+                    VALUES(?, ?)
+                ''',
+                changed
+            )
+            con.executemany('DELETE FROM moex_marketdata WHERE secid = ?', removed)
+            _db_set_sync_state(con, 'marketdata_version', data.data_version)
+        # own transaction, which takes about 3 times longer than the marketdata one: bars are history,
+        # the marketdata write shouldn't wait for them
+        with metrics.db_write_seconds.time(operation='record_price_bars'), con:
+            _db_record_prices(con, changed, current, int(time.time()))
+        logger.info(
+            f'Updated moex_marketdata table to dataversion {data.data_version}: '
+            f'{len(changed)} record(s) changed, {len(removed)} removed'
+        )
+        metrics.db_rows.set(len(data.rows), table='moex_marketdata')
+        metrics.db_changed_rows.inc(len(changed) + len(removed), table='moex_marketdata')
+        return len(changed) + len(removed)
     except Exception as e:
+        metrics.db_errors.inc(operation='update_moex_marketdata')
         logger.error(f"Failed to update moex_marketdata table:\n{e}")
-    finally:
-        con.close()
+        return 0
 
 
-def db_create_tables():
+class PriceBar(NamedTuple):
+    time: datetime.datetime
+    open: float
+    high: float
+    low: float
+    close: float
+
+
+# prices are stored as integers in 1/10000 of a percent of face value
+_price_scale = 10000
+# price bar period in seconds -> days bars are kept for, None - forever
+_price_bar_retention = {
+    60: 14,
+    3600: 366,
+    86400: None,
+}
+
+
+def _db_record_prices(con: Connection, changed: list[BondMarketData], previous: dict[str, float], ts: int):
+    """
+    Roll changed prices into the current bar of every period. Only changes are written:
+    a bond without trades has no bars, a chart keeps showing its last close.
+    A new bar opens at the 'previous' price, the close of the bar before it, so there are no gaps between bars.
+    """
+    rows = []
+    for r in changed:
+        close = round(r.last_price * _price_scale)
+        last = previous.get(r.secid)
+        open_ = round(last * _price_scale) if last is not None else close
+        for period in _price_bar_retention:
+            # open, high and low as differences to close, see _db_create_moex_price_bars_table
+            rows.append((
+                r.secid, period, ts - ts % period, close, open_ - close, max(open_ - close, 0), max(close - open_, 0),
+            ))
+    # SET expressions see the values before the update
+    con.executemany('''
+            INSERT INTO moex_price_bars VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (secid, period, ts) DO UPDATE SET
+                close = excluded.close,
+                open_d = open_d + close - excluded.close,
+                high_d = max(close + high_d, excluded.close) - excluded.close,
+                low_d = excluded.close - min(close - low_d, excluded.close)
+        ''',
+        rows
+    )
+
+
+def _price_bar_period(start: int, end: int, max_points: int) -> int:
+    """The finest period that still has bars at 'start' and gives at most 'max_points' bars."""
+    now = time.time()
+    for period, days in _price_bar_retention.items():
+        kept = days is None or start >= now - days * 86400
+        if kept and (end - start) // period <= max_points:
+            return period
+    return max(_price_bar_retention)
+
+
+def moex_price_history_db_get(
+        secid: str,
+        start: datetime.datetime,
+        end: datetime.datetime | None = None,
+        max_points: int = 2000,
+) -> list[PriceBar]:
+    """Price bars of a bond in [start, end), the bar period is picked for at most 'max_points' bars."""
+    start_ts = int(start.timestamp())
+    end_ts = int((end or datetime.datetime.now()).timestamp())
+    period = _price_bar_period(start_ts, end_ts, max_points)
+    try:
+        with metrics.query_seconds.time(operation='price_history'):
+            rows = _db_connection().execute('''
+                    SELECT ts, close, open_d, high_d, low_d
+                    FROM moex_price_bars
+                    WHERE secid = ? AND period = ? AND ts >= ? AND ts < ?
+                    ORDER BY ts
+                ''',
+                (secid, period, start_ts - start_ts % period, end_ts)
+            ).fetchall()
+    except Exception as e:
+        metrics.db_errors.inc(operation='price_history')
+        logger.error(f"DB price history query failed. secid: {secid}\nError:\n{e}")
+        return []
+    return [
+        PriceBar(
+            datetime.datetime.fromtimestamp(ts),
+            (close + open_d) / _price_scale,
+            (close + high_d) / _price_scale,
+            (close - low_d) / _price_scale,
+            close / _price_scale,
+        )
+        for ts, close, open_d, high_d, low_d in rows
+    ]
+
+
+def moex_price_history_db_prune():
+    """Drop bars older than their period's retention."""
+    con = _db_connection()
+    try:
+        now = int(time.time())
+        deleted = 0
+        for period, days in _price_bar_retention.items():
+            if days is None:
+                continue
+            with metrics.db_write_seconds.time(operation='prune_moex_price_bars'), con:
+                deleted += con.execute(
+                    'DELETE FROM moex_price_bars WHERE period = ? AND ts < ?',
+                    (period, now - days * 86400)
+                ).rowcount
+        metrics.db_changed_rows.inc(deleted, table='moex_price_bars')
+        logger.info(f'Pruned {deleted} old price bar(s)')
+    except Exception as e:
+        metrics.db_errors.inc(operation='prune_moex_price_bars')
+        logger.error(f"Failed to prune moex_price_bars table:\n{e}")
+
+
+def moex_bond_metrics_db_update():
+    """Recompute moex_bond_metrics for the whole moex_bonds x moex_marketdata universe in one batch."""
     con = _db_connection()
     try:
+        today = datetime.date.today()
+        bonds = pd.read_sql_query('''
+                SELECT
+                    moex_bonds.secid, coupon_percent, coupon_value, face_value, nkd,
+                    currency_id, face_unit, mat_date, offer_date,
+                    ifnull(last_price, prev_price) as price
+                FROM moex_bonds
+                LEFT JOIN moex_marketdata ON moex_bonds.secid = moex_marketdata.secid
+            ''',
+            con,
+        )
+        cashflows = pd.read_sql_query(
+            'SELECT secid, date, kind, value FROM moex_bond_cashflows WHERE date > ?',
+            con,
+            params=(today,),
+        )
+        bond_metrics_rows = bond_metrics(bonds, cashflows, today)
+        staging = 'moex_bond_metrics' + _staging_suffix
+        _db_create_moex_bond_metrics_table(con, staging)
+        with metrics.db_write_seconds.time(operation='load_moex_bond_metrics'), con:
+            con.executemany(f'''
+                    INSERT INTO {staging}
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''',
+                [(secid,) + tuple(m) for secid, m in bond_metrics_rows]
+            )
+        _db_swap_tables(con, ['moex_bond_metrics'], _db_create_moex_bond_metrics_indexes)
+        metrics.db_rows.set(len(bond_metrics_rows), table='moex_bond_metrics')
+        logger.info(f'Updated {len(bond_metrics_rows)} record(s) in moex_bond_metrics table')
+    except Exception as e:
+        metrics.db_errors.inc(operation='update_moex_bond_metrics')
+        logger.error(f"Failed to update moex_bond_metrics table:\n{e}")
+
+
+# bond schedules are fetched again after this many days
+_schedule_max_age_days = 7
+
+
+def moex_bond_schedules_db_update(schedules: list[BondSchedule]):
+    con = _db_connection()
+    try:
+        today = datetime.date.today()
+        with metrics.db_write_seconds.time(operation='update_moex_bond_schedules'), con:
+            con.executemany(
+                'DELETE FROM moex_bond_cashflows WHERE secid = ?',
+                [(s.secid,) for s in schedules]
+            )
+            con.executemany('''
+                    INSERT OR REPLACE INTO moex_bond_cashflows
+                    VALUES (?, ?, ?, ?)
+                ''',
+                [(s.secid,) + tuple(cf) for s in schedules for cf in s.cashflows]
+            )
+            con.executemany(
+                'INSERT OR REPLACE INTO moex_bond_schedules VALUES (?, ?)',
+                [(s.secid, today) for s in schedules]
+            )
+        metrics.db_changed_rows.inc(len(schedules), table='moex_bond_schedules')
+        logger.info(f'Updated schedules of {len(schedules)} bond(s)')
+    except Exception as e:
+        metrics.db_errors.inc(operation='update_moex_bond_schedules')
+        logger.error(f"Failed to update bond schedules:\n{e}")
+
+
+def moex_bond_cashflows_db_get(secids: list[str], after: datetime.date) -> pd.DataFrame:
+    """Schedule rows (secid, date, kind, value) of the bonds later than 'after'."""
+    if not secids:
+        return pd.DataFrame(columns=['secid', 'date', 'kind', 'value'])
+    return pd.read_sql_query(f'''
+            SELECT secid, date, kind, value
+            FROM moex_bond_cashflows
+            WHERE secid IN ({", ".join("?" * len(secids))}) AND date > ?
+        ''',
+        _db_connection(),
+        params=(*secids, after),
+    )
+
+
+def _db_stale_schedules(limit: int) -> list[str]:
+    """Bonds never fetched first, then the ones fetched longest ago."""
+    stale_before = datetime.date.today() - datetime.timedelta(days=_schedule_max_age_days)
+    return [r[0] for r in _db_connection().execute('''
+            SELECT moex_bonds.secid
+            FROM moex_bonds
+            LEFT JOIN moex_bond_schedules ON moex_bonds.secid = moex_bond_schedules.secid
+            WHERE fetched_at IS NULL OR fetched_at <= ?
+            ORDER BY fetched_at NULLS FIRST
+            LIMIT ?
+        ''',
+        (stale_before, limit)
+    ).fetchall()]
+
+
+_snapshot: BondSnapshot | None = None
+# incremented each time served data may have changed, keys result caches
+_data_generation = 0
+
+
+def _db_mark_data_updated(fetched: bool = True):
+    """
+    Let other processes know that bond data changed, see bonds_snapshot_sync.
+    Only 'fetched' moves the shown time of MOEX data: a partial load or new schedules don't make prices fresher,
+    and the time has to go stale while ISS fails.
+    """
+    now = datetime.datetime.now().isoformat()
+    con = _db_connection()
+    with con:
+        _db_set_sync_state(con, 'data_changed_at', now)
+        if fetched:
+            _db_set_sync_state(con, 'data_updated_at', now)
+
+
+def _db_data_version(con: Connection) -> str | None:
+    # DBs written before 'data_changed_at' have only the fetch time
+    return _db_get_sync_state(con, 'data_changed_at') or _db_get_sync_state(con, 'data_updated_at')
+
+
+def bonds_snapshot_refresh():
+    """Rebuild in-memory bonds snapshot from the DB and swap it in."""
+    global _snapshot, _data_generation
+    try:
+        con = _db_connection()
         with con:
-            _db_create_moex_marketdata_table(con)
-            _db_create_moex_bonds_table(con)
-    finally:
-        con.close()
+            # one read transaction, so the stamp matches the rows
+            con.execute('BEGIN')
+            updated_at = _db_get_sync_state(con, 'data_updated_at')
+            version = _db_data_version(con)
+            rows = con.execute(_bond_select).fetchall()
+        if not rows and _snapshot is not None:
+            logger.warning('No bonds in DB, keeping current bonds snapshot')
+            return
+        snapshot = BondSnapshot([_to_bond_info(r) for r in rows], updated_at, version)
+        size = snapshot.nbytes()
+        if size > _snapshot_max_bytes:
+            logger.warning(
+                f'Bonds snapshot takes {size // 1024} KiB, more than {_snapshot_max_bytes // 1024} KiB allowed, '
+                f'serving from DB'
+            )
+            _snapshot = None
+            _data_generation += 1
+            return
+        # bumped after the swap: a result of the old snapshot must not be cached for the new generation
+        old_snapshot = _snapshot
+        _snapshot = snapshot
+        _data_generation += 1
+        _publish_prices(old_snapshot, snapshot)
+        metrics.db_rows.set(len(snapshot), table='snapshot')
+        logger.info(f'Loaded bonds snapshot: {len(snapshot)} bond(s), {size // 1024} KiB')
+    except Exception as e:
+        metrics.db_errors.inc(operation='snapshot_refresh')
+        logger.error(f"Failed to load bonds snapshot:\n{e}")
+
+
+def _publish_prices(old: BondSnapshot | None, new: BondSnapshot):
+    """Push changed prices of subscribed bonds, in every process that refreshes its snapshot."""
+    changed = {}
+    for secid in price_hub.secids():
+        bond = new.get(secid)
+        old_bond = old.get(secid) if old is not None else None
+        if bond is not None and bond.prev_price is not None and (old_bond is None or old_bond.prev_price != bond.prev_price):
+            changed[secid] = bond.prev_price
+    if changed:
+        price_hub.publish(changed)
+        metrics.live_price_pushes.inc(len(changed))
+
+
+def bonds_snapshot_sync():
+    """Reload bonds snapshot if another process has committed newer data."""
+    try:
+        version = _db_data_version(_db_connection())
+    except sqlite3.Error as e:
+        logger.warning(f"Can't check bonds data state:\n{e}")
+        return
+    snapshot = _snapshot
+    if version is not None and (snapshot is None or snapshot.data_version != version):
+        bonds_snapshot_refresh()
+
+
+def bonds_data_generation() -> int:
+    """Changes whenever served bond data may have changed, for caches outside this module."""
+    return _data_generation
+
+
+def bonds_data_loaded() -> bool:
+    """Whether there is bond data to serve, even if the last MOEX load was partial."""
+    if _snapshot is not None:
+        return True
+    try:
+        return _db_data_version(_db_connection()) is not None
+    except sqlite3.Error:
+        return False
+
+
+def bonds_data_updated_at() -> datetime.datetime | None:
+    """When the served bond data was fetched from MOEX, None if there is no data yet."""
+    snapshot = _snapshot
+    if snapshot is not None:
+        updated_at = snapshot.data_updated_at
+    else:
+        try:
+            updated_at = _db_get_sync_state(_db_connection(), 'data_updated_at')
+        except sqlite3.Error:
+            updated_at = None
+    return datetime.datetime.fromisoformat(updated_at) if updated_at else None
+
+
+def _migrate_v1(con: Connection):
+    # first versioned schema, tables of unversioned DBs are recreated: it's a cache of MOEX data
+    _db_create_moex_sync_state_table(con)
+    _db_create_moex_marketdata_table(con)
+    _db_create_moex_bonds_table(con)
+    _db_create_moex_bonds_fts_table(con)
+    _db_create_moex_bond_metrics_table(con)
+    _db_create_moex_bond_metrics_indexes(con)
+
+
+def _migrate_v2(con: Connection):
+    # coupon schedules and yield computed from them
+    _db_create_moex_bond_schedule_tables(con)
+    _db_add_column(con, 'moex_bond_metrics', 'ytm', 'REAL')
+    _db_create_moex_bond_metrics_indexes(con)
+
+
+def _migrate_v3(con: Connection):
+    # indexes for screener keyset pagination
+    for column in ('current_yield', 'days_to_redemption', 'yield_to_redemption', 'ytm'):
+        con.execute(f'DROP INDEX IF EXISTS moex_bond_metrics_{column}')
+    _db_create_moex_bond_metrics_indexes(con)
+    _db_create_moex_bonds_indexes(con)
+
+
+def _migrate_v4(con: Connection):
+    # intraday price history
+    _db_create_moex_price_bars_table(con)
+
+
+# schema version N is reached by applying _migrations[N - 1] to version N - 1,
+# new migrations must keep existing data (ALTER TABLE, CREATE ... IF NOT EXISTS)
+_migrations = [
+    _migrate_v1,
+    _migrate_v2,
+    _migrate_v3,
+    _migrate_v4,
+]
+
+
+def db_migrate():
+    """Bring DB schema to the current version, keeping the data of an up to date DB."""
+    con = _db_connection()
+    with con:
+        con.execute('BEGIN IMMEDIATE')
+        version = con.execute('PRAGMA user_version').fetchone()[0]
+        for i, migration in enumerate(_migrations[version:], start=version + 1):
+            logger.info(f'Migrating DB schema to version {i}')
+            migration(con)
+            con.execute(f'PRAGMA user_version = {i}')
+
+
+# seconds for all ISS requests of one job together, each request has its own timeouts in IssClient as well
+_fetch_timeout = 120
+# loaded schedules are written in chunks of this size while the rest are loading
+_schedule_write_batch = 20
 
 
 def update_local_bonds_db():
-    logger.info(f'Loading bond securities from MOEX...')
-    data = load_moex_securities()
-    logger.info(f'Loaded {len(data)} bond securities from MOEX')
-    moex_bonds_db_update(data)
+    """Load securities and marketdata at the same time, each is written as soon as it arrives."""
+    with metrics.timed_job('update_securities'):
+        logger.info(f'Loading bond securities and marketdata from MOEX...')
+        errors = []
+        results = fetch_concurrently(
+            {'securities': load_moex_securities, 'marketdata': load_moex_marketdata},
+            timeout=_fetch_timeout,
+        )
+        for name, result in results:
+            if isinstance(result, Exception):
+                logger.error(f'Failed to load {name} from MOEX:\n{result}')
+                errors.append(result)
+            elif name == 'securities':
+                logger.info(f'Loaded {len(result)} bond securities from MOEX')
+                moex_bonds_db_update(result)
+            else:
+                logger.info(f'Loaded {len(result.rows)} bonds marketdata from MOEX')
+                moex_marketdata_db_update(result)
+        if len(errors) < 2:
+            moex_bond_metrics_db_update()
+            _db_mark_data_updated(fetched=not errors)
+            bonds_snapshot_refresh()
+        if errors:
+            raise errors[0]
+
+
+def update_local_bond_schedules(batch: int = 100) -> int:
+    with metrics.timed_job('update_schedules'):
+        secids = _db_stale_schedules(batch)
+        if not secids:
+            return 0
+        logger.info(f'Loading schedules of {len(secids)} bond(s) from MOEX...')
+        loaded = 0
+        schedules = []
+        results = fetch_concurrently(
+            {secid: lambda secid=secid: load_moex_bondization(secid) for secid in secids},
+            timeout=_fetch_timeout,
+        )
+        for secid, result in results:
+            if isinstance(result, Exception):
+                metrics.db_errors.inc(operation='load_moex_bondization')
+                logger.error(f"Failed to load schedule of {secid}:\n{result}")
+                continue
+            schedules.append(result)
+            if len(schedules) == _schedule_write_batch:
+                moex_bond_schedules_db_update(schedules)
+                loaded += len(schedules)
+                schedules = []
+        if schedules:
+            moex_bond_schedules_db_update(schedules)
+            loaded += len(schedules)
+        if loaded:
+            moex_bond_metrics_db_update()
+            _db_mark_data_updated(fetched=False)
+            bonds_snapshot_refresh()
+        return loaded
 
 
 def update_local_db_marketdata():
-    logger.info(f'Loading bonds marketdata from MOEX...')
-    data = load_moex_marketdata()
-    logger.info(f'Loaded {len(data)} bonds marketdata from MOEX')
-    moex_marketdata_db_update(data)
+    with metrics.timed_job('update_marketdata'):
+        logger.info(f'Loading bonds marketdata from MOEX...')
+        data = load_moex_marketdata()
+        logger.info(f'Loaded {len(data.rows)} bonds marketdata from MOEX')
+        changed = moex_marketdata_db_update(data)
+        if changed:
+            moex_bond_metrics_db_update()
+            _db_mark_data_updated()
+            bonds_snapshot_refresh()
+        return changed
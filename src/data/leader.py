@@ -0,0 +1,50 @@
+import fcntl
+import logging
+import os
+
+from .db import _db_name
+
+# next to the DB file, all gunicorn workers of a container share it
+_lock_name = f'{_db_name}.lock'
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """
+    Non-blocking exclusive file lock electing the one process that fetches data from MOEX.
+    The OS releases the lock when the holder exits, so another process can take over.
+    """
+
+    def __init__(self, path: str = _lock_name):
+        self.path = path
+        self._fd: int | None = None
+        self._pid: int | None = None
+
+    @property
+    def is_held(self) -> bool:
+        # a lock inherited over fork belongs to the parent
+        return self._fd is not None and self._pid == os.getpid()
+
+    def try_acquire(self) -> bool:
+        if self.is_held:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        self._pid = os.getpid()
+        logger.info(f'Process {self._pid} holds {self.path}')
+        return True
+
+    def release(self):
+        if not self.is_held:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+        logger.info(f'Process {os.getpid()} released {self.path}')
@@ -0,0 +1,94 @@
+import threading
+
+
+class _Channel:
+    __slots__ = ('price', 'seq', 'subscribers', 'changed')
+
+    def __init__(self, lock: threading.Lock):
+        self.price: float | None = None
+        self.seq = 0
+        self.subscribers = 0
+        # waiters of this secid only, so a publish wakes nobody else
+        self.changed = threading.Condition(lock)
+
+
+class PriceSubscription:
+    def __init__(self, hub: 'PriceHub', secid: str, channel: _Channel):
+        self.hub = hub
+        self.secid = secid
+        self._channel = channel
+        self._seen = channel.seq
+        self._closed = False
+
+    def wait(self, timeout: float) -> float | None:
+        """Next price of the bond, None if it didn't change within 'timeout' seconds."""
+        channel = self._channel
+        with channel.changed:
+            if channel.changed.wait_for(lambda: channel.seq != self._seen, timeout):
+                self._seen = channel.seq
+                return channel.price
+        return None
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.hub._unsubscribe(self.secid)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PriceHub:
+    """
+    Per-secid fan-out of price changes to waiting subscribers, f.e. server-sent event streams.
+    An idle subscriber costs a blocked thread and a counter, publishing touches subscribed bonds only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels: dict[str, _Channel] = {}
+        self._subscribers = 0
+
+    def subscribe(self, secid: str, limit: int | None = None) -> PriceSubscription | None:
+        """None if there are already 'limit' subscribers, of all bonds together."""
+        with self._lock:
+            if limit is not None and self._subscribers >= limit:
+                return None
+            channel = self._channels.get(secid)
+            if channel is None:
+                channel = self._channels[secid] = _Channel(self._lock)
+            channel.subscribers += 1
+            self._subscribers += 1
+            return PriceSubscription(self, secid, channel)
+
+    def _unsubscribe(self, secid: str):
+        with self._lock:
+            self._subscribers -= 1
+            channel = self._channels[secid]
+            channel.subscribers -= 1
+            if channel.subscribers == 0:
+                del self._channels[secid]
+
+    def secids(self) -> list[str]:
+        """Bonds with at least one subscriber."""
+        with self._lock:
+            return list(self._channels)
+
+    def publish(self, prices: dict[str, float]):
+        with self._lock:
+            for secid, price in prices.items():
+                channel = self._channels.get(secid)
+                if channel is not None:
+                    channel.price = price
+                    channel.seq += 1
+                    channel.changed.notify_all()
+
+    def subscribers(self) -> int:
+        with self._lock:
+            return self._subscribers
+
+
+price_hub = PriceHub()
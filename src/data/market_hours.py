@@ -0,0 +1,82 @@
+import os
+from datetime import date, datetime, time, timedelta, timezone
+
+from apscheduler.triggers.base import BaseTrigger
+
+# Moscow has no DST, a fixed offset doesn't need tz database in the image
+_moex_tz = timezone(timedelta(hours=3), 'MSK')
+# bond market from the morning to the end of the evening session, Moscow time
+_session_open = time(6, 50)
+_session_close = time(23, 50)
+# (month, day) of public holidays the exchange is usually closed on
+_moex_holidays = frozenset({
+    (1, 1), (1, 2), (1, 3), (1, 4), (1, 5), (1, 6), (1, 7), (1, 8),
+    (2, 23), (3, 8), (5, 1), (5, 9), (6, 12), (11, 4), (12, 31),
+})
+# extra closed days announced by the exchange, f.e. MOEX_EXTRA_HOLIDAYS=2026-05-11,2026-06-15
+_moex_extra_holidays = frozenset(
+    date.fromisoformat(d) for d in os.environ.get('MOEX_EXTRA_HOLIDAYS', '').split(',') if d
+)
+
+
+def is_trading_day(d: date) -> bool:
+    return d.weekday() < 5 and (d.month, d.day) not in _moex_holidays and d not in _moex_extra_holidays
+
+
+def is_trading_time(dt: datetime) -> bool:
+    """Whether MOEX bond market is open at 'dt' (naive means local time)."""
+    msk = dt.astimezone(_moex_tz)
+    return is_trading_day(msk.date()) and _session_open <= msk.time() < _session_close
+
+
+def next_session_open(dt: datetime) -> datetime:
+    """Start of the first trading session after 'dt'."""
+    d = dt.astimezone(_moex_tz).date()
+    while True:
+        opening = datetime.combine(d, _session_open, _moex_tz)
+        if opening > dt and is_trading_day(d):
+            return opening
+        d += timedelta(days=1)
+
+
+class MarketHoursTrigger(BaseTrigger):
+    """
+    Fires every 'trading_interval' while the market is open and every 'idle_interval' when it's closed,
+    waking up at the session open instead of sleeping through it. Up to 'jitter' seconds are added to each run.
+    """
+    __slots__ = ('trading_interval', 'idle_interval', 'jitter')
+
+    def __init__(self, trading_interval: timedelta, idle_interval: timedelta, jitter: float | None = None):
+        self.trading_interval = trading_interval
+        self.idle_interval = idle_interval
+        self.jitter = jitter
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        start = previous_fire_time or now
+        if is_trading_time(start):
+            next_fire_time = start + self.trading_interval
+        else:
+            next_fire_time = min(start + self.idle_interval, next_session_open(start))
+        # don't catch up on runs missed while the process was busy or asleep
+        if next_fire_time < now:
+            next_fire_time = now
+        return self._apply_jitter(next_fire_time, self.jitter, now)
+
+    def __getstate__(self):
+        return {
+            'version': 1,
+            'trading_interval': self.trading_interval,
+            'idle_interval': self.idle_interval,
+            'jitter': self.jitter,
+        }
+
+    def __setstate__(self, state):
+        self.trading_interval = state['trading_interval']
+        self.idle_interval = state['idle_interval']
+        self.jitter = state['jitter']
+
+    def __repr__(self):
+        return (
+            f'<{self.__class__.__name__} (trading_interval={self.trading_interval!r}, '
+            f'idle_interval={self.idle_interval!r}, jitter={self.jitter})>'
+        )
@@ -0,0 +1,177 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable
+
+# Minimal in-process metrics in Prometheus text exposition format.
+# Recording is a dict update under a lock, cheap enough for request paths.
+
+_registry: list['_Metric'] = []
+
+# seconds, from a cached search up to a full securities reload
+_default_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_size_buckets = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _labels_str(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(v: str) -> str:
+    return v.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(v: float) -> str:
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[n] for n in self.label_names)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            return [f'{self.name}{_labels_str(self.label_names, k)} {_number(v)}' for k, v in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_to_current_time(self, **labels):
+        self.set(time.time(), **labels)
+
+
+class CallbackGauge(_Metric):
+    """Gauge read from the application at scrape time, f.e. cache statistics."""
+    type = 'gauge'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels: tuple[str, ...],
+            collect: Callable[[], dict[tuple, float]],
+            type: str = 'gauge',
+    ):
+        super().__init__(name, documentation, labels)
+        self.type = type
+        self._collect = collect
+
+    def _samples(self) -> list[str]:
+        return [f'{self.name}{_labels_str(self.label_names, k)} {_number(v)}' for k, v in self._collect().items()]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets=_default_buckets):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # per bucket counts (not cumulative), +Inf bucket, sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, counts in values:
+            total = 0
+            for le, count in zip(self.buckets + (float('inf'),), counts):
+                total += count
+                bucket = _labels_str(self.label_names, key, 'le="' + _number(le) + '"')
+                lines.append(f'{self.name}_bucket{bucket} {total}')
+            lines.append(f'{self.name}_sum{_labels_str(self.label_names, key)} {_number(counts[-1])}')
+            lines.append(f'{self.name}_count{_labels_str(self.label_names, key)} {total}')
+        return lines
+
+
+def render() -> str:
+    return '\n'.join(m.render() for m in _registry) + '\n'
+
+
+# metrics recorded by the data layer and the pages
+
+job_seconds = Histogram('bonds_job_duration_seconds', 'Duration of scheduled MOEX jobs.', ('job',))
+job_last_success = Gauge('bonds_job_last_success_timestamp_seconds', 'Unix time of the last successful job run.', ('job',))
+job_failures = Counter('bonds_job_failures_total', 'Scheduled MOEX job runs that raised an error.', ('job',))
+db_errors = Counter('bonds_db_errors_total', 'DB operations that failed and were only logged.', ('operation',))
+db_rows = Gauge('bonds_db_rows', 'Rows written by the last successful update.', ('table',))
+db_changed_rows = Counter('bonds_db_changed_rows_total', 'Inserted, updated or deleted rows.', ('table',))
+db_write_seconds = Histogram(
+    'bonds_db_write_lock_seconds',
+    'Time spent in write transactions holding (or waiting for) the DB write lock.',
+    ('operation',),
+)
+iss_request_seconds = Histogram('bonds_iss_request_duration_seconds', 'MOEX ISS request duration, retries included.', ('endpoint',))
+iss_response_bytes = Histogram('bonds_iss_response_bytes', 'Decoded size of MOEX ISS responses.', ('endpoint',), _size_buckets)
+iss_not_modified = Counter('bonds_iss_not_modified_total', 'MOEX ISS responses answered with 304 Not Modified.', ('endpoint',))
+query_seconds = Histogram('bonds_query_duration_seconds', 'Bond search, get and screener latency, cache included.', ('operation',))
+live_price_pushes = Counter('bonds_live_price_pushes_total', 'Bond price changes pushed to live subscribers.')
+live_streams_rejected = Counter('bonds_live_streams_rejected_total', 'Live price streams refused with 503 over the stream limit.')
+page_seconds = Histogram('bonds_page_duration_seconds', 'Server-side page layout and callback latency.', ('page',))
+
+
+@contextmanager
+def timed_job(job: str):
+    """Record duration, last success time and failures of one scheduled job run."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        job_failures.inc(job=job)
+        raise
+    else:
+        job_last_success.set_to_current_time(job=job)
+    finally:
+        job_seconds.observe(time.perf_counter() - start, job=job)
@@ -1,11 +1,137 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date
+from functools import cache
+from itertools import compress, starmap
 from dateutil.parser import parse
-from typing import NamedTuple
+from typing import Callable, Hashable, Iterator, NamedTuple, TypeVar
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+from .calc import BondMetrics
 from .util import write_date
 
 _moex_options = 'iss.json=compact&iss.meta=off&iss.dp=dot'
+# may point to a local stand-in server, f.e. http://127.0.0.1:8000/iss
+_moex_iss_url = os.environ.get('MOEX_ISS_URL', 'https://iss.moex.com/iss')
+# boards whose rows are skipped, f.e. SPOB duplicates bonds of other boards
+_moex_ignored_boards = frozenset(os.environ.get('MOEX_IGNORED_BOARDS', 'SPOB').split(','))
+# ISS requests run at the same time, no more than pooled connections
+_iss_concurrency = 4
+# endpoints fetched with conditional GETs: one URL each, polled over and over. Per bond requests, f.e. 'bondization',
+# aren't cached, there are thousands of them and each is repeated only days later
+_iss_conditional_endpoints = frozenset({'securities', 'marketdata'})
+T = TypeVar('T')
+
+logger = logging.getLogger(__name__)
+
+
+class IssClient:
+    """
+    MOEX ISS client: pooled keep-alive session, gzip, timeouts,
+    bounded retries with backoff and conditional GETs (ETag / Last-Modified) of 'conditional_endpoints'.
+    """
+
+    def __init__(
+            self,
+            base_url: str = _moex_iss_url,
+            connect_timeout: float = 5,
+            read_timeout: float = 30,
+            retries: int = 3,
+            backoff_factor: float = 1,
+            pool_maxsize: int = _iss_concurrency,
+            conditional_endpoints: frozenset[str] = _iss_conditional_endpoints,
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=('GET',),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.conditional_endpoints = conditional_endpoints
+        # url -> (validator headers, parsed json) of the last 200 response
+        self._cache: dict[str, tuple[dict[str, str], dict]] = {}
+        self._lock = threading.Lock()
+
+    def get_json(self, path: str, query: str, endpoint: str = 'other') -> dict:
+        """'endpoint' is a short name of the request in metrics, only 'conditional_endpoints' are cached."""
+        url = f'{self.base_url}/{path.lstrip("/")}?{query}'
+        conditional = endpoint in self.conditional_endpoints
+        with self._lock:
+            cached = self._cache.get(url) if conditional else None
+        with metrics.iss_request_seconds.time(endpoint=endpoint):
+            r = self.session.get(url, timeout=self.timeout, headers=cached[0] if cached else None)
+        if r.status_code == 304 and cached:
+            logger.debug(f'ISS {path}: not modified')
+            metrics.iss_not_modified.inc(endpoint=endpoint)
+            return cached[1]
+        r.raise_for_status()
+        metrics.iss_response_bytes.observe(len(r.content), endpoint=endpoint)
+        j = _json_loads(r.content)
+        if not conditional:
+            return j
+        validators = {}
+        if 'ETag' in r.headers:
+            validators['If-None-Match'] = r.headers['ETag']
+        if 'Last-Modified' in r.headers:
+            validators['If-Modified-Since'] = r.headers['Last-Modified']
+        with self._lock:
+            if validators:
+                self._cache[url] = (validators, j)
+            else:
+                self._cache.pop(url, None)
+        return j
+
+    def close(self):
+        self.session.close()
+
+
+iss = IssClient()
+
+
+def fetch_concurrently(
+        loaders: dict[Hashable, Callable[[], T]],
+        timeout: float | None = None,
+        max_workers: int = _iss_concurrency,
+) -> Iterator[tuple[Hashable, T | Exception]]:
+    """
+    Run blocking ISS loaders in parallel and yield (key, result or exception) as soon as each one completes,
+    so the caller can write results while the rest are still loading.
+    Loaders not done within 'timeout' seconds (all together) are yielded with TimeoutError.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='iss')
+    futures = {executor.submit(loader): key for key, loader in loaders.items()}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            e = future.exception()
+            yield futures[future], e if e is not None else future.result()
+    except TimeoutError:
+        for future in pending:
+            yield futures[future], TimeoutError(f'ISS request not done in {timeout} s')
+    finally:
+        # a request stuck past its own timeouts must not hold up the job
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _json_loads(content: bytes) -> dict:
+    # all ISS responses are decoded here, bench/run.py decodes the fixtures the same way
+    return json.loads(content)
 
 
 class BasicBondInfo(NamedTuple):
@@ -42,65 +168,140 @@ class BasicBondInfo(NamedTuple):
     # MOEX: REGNUMBER
     reg_number: str | None
     # NOTE: update 'select' in db.py when adding more columns
+    # derived values from moex_bond_metrics table, not stored in moex_bonds
+    metrics: BondMetrics | None = None
+
+
+_securities_columns = 'SECID,ISIN,SHORTNAME,STATUS,BOARDID,MATDATE,COUPONPERCENT,LISTLEVEL,COUPONVALUE,NEXTCOUPON,ACCRUEDINT,CURRENCYID,FACEUNIT,FACEVALUE,COUPONPERIOD,ISSUESIZE,OFFERDATE,PREVPRICE,REGNUMBER'
 
 
 def load_moex_securities() -> list[BasicBondInfo]:
-    columns = 'SECID,ISIN,SHORTNAME,STATUS,BOARDID,MATDATE,COUPONPERCENT,LISTLEVEL,COUPONVALUE,NEXTCOUPON,ACCRUEDINT,CURRENCYID,FACEUNIT,FACEVALUE,COUPONPERIOD,ISSUESIZE,OFFERDATE,PREVPRICE,REGNUMBER'
-    url = f'https://iss.moex.com/iss/engines/stock/markets/bonds/securities.json?{_moex_options}&iss.only=securities&securities.columns={columns}'
-    j = requests.get(url).json()
-    data = _to_dict(j['securities'], columns.split(sep=','))
-    data = [
-        BasicBondInfo(
-            b['SHORTNAME'],
-            b['SECID'],
-            b['ISIN'],
-            _to_optional_date(b['MATDATE']),
-            b['COUPONPERCENT'],
-            b['LISTLEVEL'],
-            # MOEX API: 0 if unknown
-            b['COUPONVALUE'] if b['COUPONVALUE'] != 0 else None,
-            _to_date(b['NEXTCOUPON']),
-            b['ACCRUEDINT'],
-            b['CURRENCYID'],
-            b['FACEUNIT'],
-            b['FACEVALUE'],
-            b['COUPONPERIOD'],
-            b['ISSUESIZE'],
-            _to_optional_date(b['OFFERDATE']),
-            float(b['PREVPRICE']) if b['PREVPRICE'] is not None else None,
-            b['REGNUMBER'],
-        )
-        for b in data
+    j = iss.get_json(
+        'engines/stock/markets/bonds/securities.json',
+        f'{_moex_options}&iss.only=securities&securities.columns={_securities_columns}',
+        endpoint='securities',
+    )
+    return parse_moex_securities(j)
+
+
+def parse_moex_securities(j: dict) -> list[BasicBondInfo]:
+    c = _to_columns(j['securities'], _securities_columns.split(sep=','))
+    keep = [
         # there are bonds with zeroes in 'NEXTCOUPON' field, f.e. RU000A109K81
-        if (b['BOARDID'] != 'SPOB' and b['NEXTCOUPON'] != '0000-00-00')
+        board not in _moex_ignored_boards and next_coupon != '0000-00-00'
+        for board, next_coupon in zip(c['BOARDID'], c['NEXTCOUPON'])
     ]
-    return data
+
+    def col(name: str):
+        return compress(c[name], keep)
+
+    return list(starmap(BasicBondInfo, zip(
+        col('SHORTNAME'),
+        col('SECID'),
+        col('ISIN'),
+        map(_to_optional_date, col('MATDATE')),
+        col('COUPONPERCENT'),
+        col('LISTLEVEL'),
+        # MOEX API: 0 if unknown
+        (v if v != 0 else None for v in col('COUPONVALUE')),
+        map(_to_date, col('NEXTCOUPON')),
+        col('ACCRUEDINT'),
+        col('CURRENCYID'),
+        col('FACEUNIT'),
+        col('FACEVALUE'),
+        col('COUPONPERIOD'),
+        col('ISSUESIZE'),
+        map(_to_optional_date, col('OFFERDATE')),
+        (float(v) if v is not None else None for v in col('PREVPRICE')),
+        col('REGNUMBER'),
+    )))
 
 class BondMarketData(NamedTuple):
     secid: str
     last_price: float
 
 
-def load_moex_marketdata() -> list[BondMarketData]:
+class MoexMarketData(NamedTuple):
+    # ISS 'dataversion' block joined into one string, None if ISS didn't send it
+    data_version: str | None
+    rows: list[BondMarketData]
+
+
+def load_moex_marketdata() -> MoexMarketData:
     columns = 'BOARDID,SECID,LAST'
-    url = f'https://iss.moex.com/iss/engines/stock/markets/bonds/securities.json?{_moex_options}&iss.only=marketdata,dataversion&marketdata.columns={columns}'
-    j = requests.get(url).json()
-    data = _to_dict(j['marketdata'], columns.split(sep=','))
-    return [
-        BondMarketData(
-            r['SECID'],
-            float(r['LAST']),
+    j = iss.get_json(
+        'engines/stock/markets/bonds/securities.json',
+        f'{_moex_options}&iss.only=marketdata,dataversion&marketdata.columns={columns}',
+        endpoint='marketdata',
+    )
+    return parse_moex_marketdata(j)
+
+
+def parse_moex_marketdata(j: dict) -> MoexMarketData:
+    c = _to_columns(j['marketdata'], ['BOARDID', 'SECID', 'LAST'])
+    return MoexMarketData(
+        _data_version(j.get('dataversion')),
+        [
+            BondMarketData(secid, float(last))
+            for board, secid, last in zip(c['BOARDID'], c['SECID'], c['LAST'])
+            if (board not in _moex_ignored_boards and last is not None)
+        ],
+    )
+
+
+class BondCashflow(NamedTuple):
+    date: date
+    # 'C' - coupon, 'A' - amortization (incl. redemption at maturity), 'O' - offer
+    kind: str
+    # coupon or amortization per bond in face currency, None if not known yet (f.e. floater coupons);
+    # offer price in % of face value
+    value: float | None
+
+
+class BondSchedule(NamedTuple):
+    secid: str
+    cashflows: list[BondCashflow]
+
+
+def load_moex_bondization(secid: str) -> BondSchedule:
+    j = iss.get_json(
+        f'statistics/engines/stock/markets/bonds/bondization/{secid}.json',
+        f'{_moex_options}&iss.only=coupons,amortizations,offers&limit=unlimited',
+        endpoint='bondization',
+    )
+    return parse_moex_bondization(secid, j)
+
+
+def parse_moex_bondization(secid: str, j: dict) -> BondSchedule:
+    cashflows = []
+    for table, kind, date_column, value_column in (
+            ('coupons', 'C', 'coupondate', 'value'),
+            ('amortizations', 'A', 'amortdate', 'value'),
+            ('offers', 'O', 'offerdate', 'price'),
+    ):
+        if table not in j:
+            continue
+        c = _to_columns(j[table], [date_column, value_column])
+        cashflows.extend(
+            BondCashflow(_to_date(d), kind, float(v) if v is not None else None)
+            for d, v in zip(c[date_column], c[value_column])
+            if d and d != '0000-00-00'
         )
-        for r in data
-        if (r['BOARDID'] != 'SPOB' and r['LAST'] is not None)
-    ]
+    return BondSchedule(secid, cashflows)
 
 
-def _to_dict(moex_json, columns: list[str]):
-    return [
-        {k : r[i] for i, k in enumerate(moex_json['columns']) if k in columns}
-                  for r in moex_json['data']
-    ]
+def _data_version(moex_json) -> str | None:
+    # f.e. {"columns": ["data_version", "seqnum", "trade_date", "trade_session_date"], "data": [[...]]}
+    if not moex_json or not moex_json['data']:
+        return None
+    return '/'.join(str(v) for v in moex_json['data'][0])
+
+
+def _to_columns(moex_json, columns: list[str]) -> dict[str, tuple]:
+    """Decode ISS compact table into columns, column positions are looked up once per table."""
+    positions = [moex_json['columns'].index(k) for k in columns]
+    data = list(zip(*moex_json['data'])) or [()] * len(moex_json['columns'])
+    return {k: data[i] for k, i in zip(columns, positions)}
 
 
 def _fix_date(date_str: str) -> str:
@@ -110,11 +311,14 @@ def _fix_date(date_str: str) -> str:
         return ''
 
 
+# there are a few thousand distinct dates in the whole bond universe
+@cache
 def _to_optional_date(date_str: str) -> date | None:
     if date_str and date_str != '0000-00-00':
         return date.fromisoformat(date_str)
     else: return None
 
 
+@cache
 def _to_date(date_str: str) -> date:
     return date.fromisoformat(date_str)
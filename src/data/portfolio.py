@@ -0,0 +1,237 @@
+import hashlib
+import re
+from datetime import date, timedelta
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from .cache import VersionedLruCache
+from .calc import schedule_flows, flow_matrix, solve_ytm, duration, dirty_price
+from .db import moex_bonds_db_get, moex_bonds_db_search, moex_bond_cashflows_db_get, bonds_data_generation
+from .moex import BasicBondInfo
+
+
+class Holding(NamedTuple):
+    secid: str
+    quantity: float
+    # % of face value, optional
+    buy_price: float | None = None
+
+
+class PortfolioPosition(NamedTuple):
+    secid: str
+    shortname: str
+    quantity: float
+    face_unit: str
+    # % of face value
+    price: float | None
+    # quantity * dirty price, face currency
+    value: float | None
+    # effective yield to redemption date, %
+    ytm: float | None
+    # Macaulay, years
+    duration: float | None
+    # vs buy price, without coupons, face currency
+    profit: float | None
+
+
+class PortfolioSummary(NamedTuple):
+    face_unit: str
+    value: float
+    # effective yield of all cash flows of the currency against their total value, %
+    ytm: float | None
+    duration: float | None
+    modified_duration: float | None
+
+
+class PortfolioCashflow(NamedTuple):
+    date: date
+    face_unit: str
+    coupons: float
+    # amortizations, redemptions and offers
+    redemptions: float
+
+
+class PortfolioResult(NamedTuple):
+    positions: list[PortfolioPosition]
+    summary: list[PortfolioSummary]
+    calendar: list[PortfolioCashflow]
+    # secids or isins that weren't found
+    not_found: list[str]
+
+
+# numbers float() accepts: '10', '10.', '10.5', '.5', but not '1.2.3' or '.'
+_number = r'(\d+(?:\.\d*)?|\.\d+)'
+_holding_line = re.compile(rf'^\s*([^\s;,]+)[\s;,]+{_number}(?:[\s;,]+{_number})?\s*$')
+
+
+def parse_holdings(text: str) -> tuple[list[Holding], list[str]]:
+    """
+    Holdings from lines 'secid-or-isin quantity [buy price]', separated by spaces, ';' or ','.
+    Returns holdings and the lines that couldn't be parsed.
+    """
+    holdings = []
+    errors = []
+    for line in text.splitlines():
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        m = _holding_line.match(line)
+        if m is None:
+            errors.append(line)
+            continue
+        ticker, quantity, buy_price = m.groups()
+        holdings.append(Holding(ticker.upper(), float(quantity), float(buy_price) if buy_price else None))
+    return holdings, errors
+
+
+def _find_bond(ticker: str) -> BasicBondInfo | None:
+    bond = moex_bonds_db_get(ticker)
+    if bond is None:
+        bond = next((b for b in moex_bonds_db_search(ticker, 5) if b.isin == ticker), None)
+    return bond
+
+
+def _canonical(holdings: list[Holding]) -> tuple[Holding, ...]:
+    """Same positions in any order, repeated tickers merged with quantity-weighted buy price."""
+    merged: dict[str, tuple[float, float, float]] = {}
+    for h in holdings:
+        quantity, cost, priced = merged.get(h.secid, (0.0, 0.0, 0.0))
+        if h.buy_price is not None:
+            cost += h.buy_price * h.quantity
+            priced += h.quantity
+        merged[h.secid] = (quantity + h.quantity, cost, priced)
+    return tuple(
+        Holding(secid, quantity, cost / priced if priced else None)
+        for secid, (quantity, cost, priced) in sorted(merged.items())
+    )
+
+
+def _coupon_cashflows(bonds: list[BasicBondInfo], today: date) -> pd.DataFrame:
+    """Schedule of bonds without a loaded one: regular coupons from the next coupon date till redemption."""
+    rows = []
+    for b in bonds:
+        redemption = b.offer_date or b.mat_date
+        if redemption is None:
+            continue
+        d = b.coupon_date
+        period = timedelta(days=b.coupon_period) if b.coupon_period else None
+        while d is not None and today < d <= redemption:
+            rows.append((b.secid, d, 'C', b.coupon_value))
+            d = d + period if period else None
+        if b.offer_date:
+            rows.append((b.secid, b.offer_date, 'O', 100.0))
+    # typed also without rows, as the only schedule it is filled and compared in schedule_flows
+    return pd.DataFrame(rows, columns=['secid', 'date', 'kind', 'value']).astype({'value': np.float64})
+
+
+def _nan_to_none(v: float, digits: int = 2) -> float | None:
+    return None if np.isnan(v) else round(float(v), digits)
+
+
+def _evaluate(holdings: tuple[Holding, ...], today: date) -> PortfolioResult:
+    found = [(h, _find_bond(h.secid)) for h in holdings]
+    not_found = [h.secid for h, b in found if b is None]
+    # the same bond given by secid and by isin is one position
+    by_secid = {b.secid: b for _, b in found if b is not None}
+    found = [(h, by_secid[h.secid]) for h in _canonical([h._replace(secid=b.secid) for h, b in found if b is not None])]
+    if not found:
+        return PortfolioResult([], [], [], not_found)
+    bonds = [b for _, b in found]
+    n = len(bonds)
+    df = pd.DataFrame({
+        'secid': [b.secid for b in bonds],
+        'face_value': [b.face_value for b in bonds],
+        'coupon_value': [b.coupon_value for b in bonds],
+        'redemption_date': [b.offer_date or b.mat_date for b in bonds],
+        'offer_date': [b.offer_date for b in bonds],
+        'price': [b.prev_price for b in bonds],
+        'nkd': [b.nkd for b in bonds],
+        'currency_id': [b.currency_id for b in bonds],
+        'face_unit': [b.face_unit for b in bonds],
+    })
+    cashflows = moex_bond_cashflows_db_get(list(df['secid']), today)
+    scheduled = set(cashflows['secid'])
+    estimated = _coupon_cashflows([b for b in bonds if b.secid not in scheduled], today)
+    # no concat with an empty frame, read_sql_query gives it object columns
+    if cashflows.empty:
+        cashflows = estimated
+    elif not estimated.empty:
+        cashflows = pd.concat([cashflows, estimated])
+
+    # per bond
+    flows, has_schedule = schedule_flows(df, cashflows, today)
+    times, amounts = flow_matrix(flows, n, today)
+    price = np.where(has_schedule, dirty_price(df), np.nan)
+    y = solve_ytm(price, times, amounts)
+    d = duration(times, amounts, y)
+    quantity = np.array([h.quantity for h, _ in found])
+    value = quantity * price
+    buy_price = np.array([np.nan if h.buy_price is None else h.buy_price for h, _ in found])
+    market_price = pd.to_numeric(df['price'], errors='coerce').to_numpy(dtype=np.float64)
+    face_value = pd.to_numeric(df['face_value'], errors='coerce').to_numpy(dtype=np.float64)
+    profit = quantity * (market_price - buy_price) / 100 * face_value
+
+    positions = [
+        PortfolioPosition(
+            b.secid, b.shortname, float(quantity[i]), b.face_unit, b.prev_price,
+            _nan_to_none(value[i]), _nan_to_none(y[i] * 100), _nan_to_none(d[i]), _nan_to_none(profit[i]),
+        )
+        for i, b in enumerate(bonds)
+    ]
+
+    # per currency: all cash flows of priced bonds against their total value
+    priced = ~np.isnan(y)
+    flows = flows[priced[flows['pos'].to_numpy()]].copy()
+    flows['amount'] = flows['value'] * quantity[flows['pos'].to_numpy()]
+    face_units = df['face_unit'].to_numpy()
+    flows['face_unit'] = face_units[flows['pos'].to_numpy()]
+    currencies = sorted(set(face_units[priced]))
+    if not currencies:
+        # no bond with a price and a schedule to total
+        return PortfolioResult(positions, [], [], not_found)
+    currency_pos = {c: i for i, c in enumerate(currencies)}
+    totals = np.array([value[priced & (face_units == c)].sum() for c in currencies])
+    merged = (
+        flows.groupby(['face_unit', 'date'], as_index=False)['amount'].sum()
+        .assign(pos=lambda f: f['face_unit'].map(currency_pos))
+        .rename(columns={'amount': 'value'})
+    )
+    c_times, c_amounts = flow_matrix(merged, len(currencies), today)
+    c_y = solve_ytm(totals, c_times, c_amounts)
+    c_d = duration(c_times, c_amounts, c_y)
+    summary = [
+        PortfolioSummary(
+            c, round(float(totals[i]), 2), _nan_to_none(c_y[i] * 100), _nan_to_none(c_d[i]),
+            _nan_to_none(c_d[i] / (1 + c_y[i])),
+        )
+        for i, c in enumerate(currencies)
+    ]
+
+    calendar = (
+        flows.assign(coupons=np.where(flows['kind'] == 'C', flows['amount'], 0.0))
+        .assign(redemptions=lambda f: f['amount'] - f['coupons'])
+        .groupby(['date', 'face_unit'], as_index=False)[['coupons', 'redemptions']].sum()
+        .sort_values(['date', 'face_unit'])
+    )
+    return PortfolioResult(
+        positions,
+        summary,
+        [
+            PortfolioCashflow(r.date.date(), r.face_unit, round(r.coupons, 2), round(r.redemptions, 2))
+            for r in calendar.itertuples()
+        ],
+        not_found,
+    )
+
+
+# portfolio hash -> result, until bond data changes
+portfolio_cache = VersionedLruCache('portfolio', maxsize=256)
+
+
+def portfolio_evaluate(holdings: list[Holding], today: date | None = None) -> PortfolioResult:
+    """Positions, per currency totals and cash flow calendar of a portfolio, all from current bond data."""
+    today = today or date.today()
+    canonical = _canonical(holdings)
+    key = hashlib.sha1(repr((canonical, today)).encode()).hexdigest()
+    return portfolio_cache.get(bonds_data_generation(), key, lambda: _evaluate(canonical, today))
@@ -0,0 +1,95 @@
+import sys
+from datetime import datetime
+
+from .moex import BasicBondInfo
+
+
+def _desc_nulls_last(field: str):
+    def key(b: BasicBondInfo):
+        v = getattr(b.metrics, field) if b.metrics else None
+        return (v is None, -(v or 0))
+    return key
+
+
+def _asc_nulls_last(field: str):
+    def key(b: BasicBondInfo):
+        v = getattr(b.metrics, field) if b.metrics else None
+        return (v is None, v or 0)
+    return key
+
+
+# same orders as _search_order in db.py, bonds are kept sorted by shortname so sort is stable on it
+_sort_keys = {
+    'shortname': None,
+    'current_yield': _desc_nulls_last('current_yield'),
+    'yield_to_redemption': _desc_nulls_last('yield_to_redemption'),
+    'days_to_redemption': _asc_nulls_last('days_to_redemption'),
+    'ytm': _desc_nulls_last('ytm'),
+}
+
+
+class BondSnapshot:
+    """
+    Immutable in-memory copy of moex_bonds joined with marketdata and metrics.
+    Built by the refresh jobs and swapped in as a whole, so readers need no locks.
+    """
+    __slots__ = ('bonds', 'data_updated_at', 'data_version', 'loaded_at', '_by_secid', '_search_keys')
+
+    def __init__(self, bonds: list[BasicBondInfo], data_updated_at: str | None = None, data_version: str | None = None):
+        self.bonds: tuple[BasicBondInfo, ...] = tuple(sorted(bonds, key=lambda b: b.shortname.casefold()))
+        # 'data_updated_at' sync state of the DB the snapshot was built from: when MOEX data was fetched
+        self.data_updated_at = data_updated_at
+        # changes with any change of the DB data, see db._db_data_version
+        self.data_version = data_version or data_updated_at
+        self.loaded_at = datetime.now()
+        self._by_secid: dict[str, BasicBondInfo] = {b.secid: b for b in self.bonds}
+        # one casefolded string per bond, fields separated by a character that can't be in a query
+        self._search_keys: tuple[str, ...] = tuple(
+            '\n'.join((b.shortname, b.isin, b.secid, b.reg_number or '')).casefold()
+            for b in self.bonds
+        )
+
+    def __len__(self):
+        return len(self.bonds)
+
+    def get(self, secid: str) -> BasicBondInfo | None:
+        return self._by_secid.get(secid)
+
+    def search(self, query: str, limit: int = 100, order_by: str = 'shortname') -> list[BasicBondInfo]:
+        """Case-insensitive substring search over shortname, isin, secid and reg_number."""
+        q = query.casefold()
+        if '\n' in q:
+            return []
+        sort_key = _sort_keys[order_by]
+        found = (b for b, key in zip(self.bonds, self._search_keys) if q in key)
+        if sort_key is None:
+            res = []
+            for b in found:
+                res.append(b)
+                if len(res) == limit:
+                    break
+            return res
+        return sorted(found, key=sort_key)[:limit]
+
+    def nbytes(self) -> int:
+        """Approximate memory used by the snapshot, shared objects are counted once."""
+        seen = set()
+        total = 0
+
+        def add(o):
+            nonlocal total
+            if id(o) not in seen:
+                seen.add(id(o))
+                total += sys.getsizeof(o)
+
+        for container in (self.bonds, self._search_keys, self._by_secid):
+            add(container)
+        for b, key in zip(self.bonds, self._search_keys):
+            add(b)
+            add(key)
+            for v in b:
+                add(v)
+            if b.metrics is not None:
+                for v in b.metrics:
+                    add(v)
+        return total
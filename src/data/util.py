@@ -1,10 +1,14 @@
 from datetime import date, datetime
 
 _date_format = '%d.%m.%Y'
+_datetime_format = '%d.%m.%Y %H:%M'
 
 def write_date(v: date) -> str:
     return v.strftime(_date_format)
 
+def write_datetime(v: datetime) -> str:
+    return v.strftime(_datetime_format)
+
 def write_optional_date(v: date | None) -> str | None:
     return None if v is None else write_date(v)
 
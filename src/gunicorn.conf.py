@@ -0,0 +1,18 @@
+# Read by gunicorn from the working directory, the rest of the settings are in the Dockerfile command.
+import os
+
+# import the app and its pages once in the master, forked workers serve right away
+preload_app = True
+
+# gthread: live price streams hold a thread and a connection each while idle, and connections over
+# worker_connections wait unaccepted, /ready included. Both are above the stream limit of app.py (_live_max_streams,
+# same variable and default), so pages, Dash callbacks and /ready are still served with all the streams open.
+# An idle stream costs ~26 KB resident, so a worker can take more of them with BONDS_LIVE_MAX_STREAMS.
+threads = int(os.environ.get('BONDS_LIVE_MAX_STREAMS', '1500')) + 500
+worker_connections = threads
+
+
+def post_fork(server, worker):
+    # the scheduler and its threads are per process, so every worker starts them after fork
+    import app
+    app.init_app()
@@ -1,11 +1,11 @@
 import dash
-from dash import html, callback, Output, Input, State, clientside_callback, ClientsideFunction
+from dash import html, dcc, callback, Output, Input, State, clientside_callback, ClientsideFunction
 import dash_bootstrap_components as dbc
 import logging
 
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from typing import Any
-from data import moex_bonds_db_get, currency_str, write_optional_date
+from data import moex_bonds_db_get, moex_price_history_db_get, currency_str, write_optional_date, metrics
 
 
 def _title(secid=""):
@@ -108,6 +108,48 @@ def result_card(
         # style={"width": "18rem"},
     )
 
+# price chart range -> days
+_chart_ranges = {
+    "день": 1,
+    "неделя": 7,
+    "месяц": 31,
+    "год": 366,
+    "5 лет": 5 * 366,
+}
+
+
+def price_chart():
+    return html.Div([
+        layout_row(
+            dbc.RadioItems(
+                options=[{"label": label, "value": days} for label, days in _chart_ranges.items()],
+                value=_chart_ranges["месяц"],
+                id="price_chart_range",
+                inline=True,
+                persistence=True,
+            )
+        ),
+        dcc.Graph(id="price_chart", config={"displayModeBar": False}, style={"height": "300px"}),
+    ], className="mt-2")
+
+
+def scenario_grid():
+    return html.Div([
+        layout_row(
+            dbc.Col(dbc.Switch(id="scenario_grid_show", label="сценарии", value=False, persistence=True)),
+            dbc.Col(dbc.RadioItems(
+                options=[{"label": "доходность", "value": "profitability"}, {"label": "прибыль", "value": "income"}],
+                value="profitability",
+                id="scenario_grid_value",
+                inline=True,
+                persistence=True,
+            ), width="auto"),
+        ),
+        # shown by the grid callback when the switch is on and there is something to draw
+        dcc.Graph(id="scenario_grid", config={"displayModeBar": False}, style={"height": "400px", "display": "none"}),
+    ], className="mt-2")
+
+
 def layout_row(*arg):
     return dbc.Row(
         children=list(arg),
@@ -137,6 +179,7 @@ def get_sell_type_options(offer_date: date | None):
     Input('buy_date', 'value'),
     prevent_initial_call=True,
 )
+@metrics.page_seconds.time(page="calc_sell_type")
 def switch_sell_type(sell_type, sell_price, mat_date, offer_date, buy_date):
     if sell_type == 'maturity':
         sell_date = mat_date
@@ -148,6 +191,66 @@ def switch_sell_type(sell_type, sell_price, mat_date, offer_date, buy_date):
         sell_date = date.fromisoformat(buy_date) + timedelta(days=1)
     return sell_date, sell_price
 
+@callback(
+    Output('price_chart', 'figure'),
+    Input('price_chart_range', 'value'),
+    State('calc_secid', 'data'),
+)
+@metrics.page_seconds.time(page="calc_price_chart")
+def draw_price_chart(days, secid):
+    bars = moex_price_history_db_get(secid, datetime.now() - timedelta(days=days)) if secid else []
+    # plain figure dict, drawn by plotly.js as is: plotly.graph_objects takes ~0.1s to load on the first call
+    # and validates every property after, plotly.js defaults look like the 'plotly_white' template
+    return {
+        "data": [{
+            "type": "scatter",
+            "x": [b.time for b in bars],
+            "y": [b.close for b in bars],
+            "mode": "lines",
+            "line": {"shape": "hv", "width": 1.5},
+            "hovertemplate": "%{x}<br>%{y}<extra></extra>",
+        }],
+        "layout": {
+            "margin": {"l": 40, "r": 10, "t": 10, "b": 30},
+            "xaxis": {"rangebreaks": [{"bounds": ["sat", "mon"]}]} if days > 1 else {},
+            "annotations": [] if bars else [{
+                "text": "нет истории цен", "showarrow": False, "xref": "paper", "yref": "paper", "x": 0.5, "y": 0.5,
+            }],
+        },
+    }
+
+# buy prices x sell dates around the entered scenario, computed in the browser
+clientside_callback(
+    ClientsideFunction(
+        namespace='clientside',
+        function_name='grid'
+    ),
+    Output('scenario_grid', 'figure'),
+    Output('scenario_grid', 'style'),
+    Input('scenario_grid_show', 'value'),
+    Input('scenario_grid_value', 'value'),
+    Input('commission', 'value'),
+    Input('tax', 'value'),
+    Input('coupon', 'value'),
+    Input('par_value', 'value'),
+    Input('buy_date', 'value'),
+    Input('buy_price', 'value'),
+    Input('sell_date', 'value'),
+    Input('sell_price', 'value'),
+    Input('sell_type', 'value'),
+)
+
+# new prices are pushed by the server and set into buy_price, which runs clientside calculate
+clientside_callback(
+    ClientsideFunction(
+        namespace='live',
+        function_name='subscribe'
+    ),
+    Output('live_price_secid', 'data'),
+    Input('calc_secid', 'data'),
+    State('buy_price', 'value'),
+)
+
 clientside_callback(
     ClientsideFunction(
         namespace='clientside',
@@ -168,6 +271,7 @@ clientside_callback(
     Input('sell_type', 'value'),
 )
 
+@metrics.page_seconds.time(page="calc")
 def layout(secid="", **kwargs):
     logger.info(f"Loading info for secid {secid} ...")
     bond_info = moex_bonds_db_get(secid)
@@ -254,6 +358,10 @@ def layout(secid="", **kwargs):
             col_input(type="number", id="sell_price", placeholder="цена", value='100')
         ),
         result_card(face_unit),
+        scenario_grid(),
+        dcc.Store(id="calc_secid", data=secid if bond_info else None),
+        dcc.Store(id="live_price_secid"),
+        price_chart(),
     ]
 
 
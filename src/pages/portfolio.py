@@ -0,0 +1,150 @@
+import base64
+
+import dash
+from dash import html, callback, dash_table, dcc, Input, Output
+import dash_bootstrap_components as dbc
+import logging
+
+from data import portfolio_evaluate, parse_holdings, PortfolioResult, currency_str, write_date, metrics
+
+dash.register_page(
+    __name__,
+    path='/portfolio',
+    title='BondsCalc | портфель'
+)
+
+logger = logging.getLogger(__name__)
+
+_positions_columns = [
+    {"name": "название", "id": "shortname", "presentation": "markdown"},
+    {"name": "кол-во", "id": "quantity"},
+    {"name": "цена", "id": "price"},
+    {"name": "стоимость", "id": "value"},
+    {"name": "валюта", "id": "face_unit"},
+    {"name": "YTM, %", "id": "ytm"},
+    {"name": "дюрация, лет", "id": "duration"},
+    {"name": "прибыль", "id": "profit"},
+]
+
+_calendar_columns = [
+    {"name": "дата", "id": "date"},
+    {"name": "купоны", "id": "coupons"},
+    {"name": "погашения", "id": "redemptions"},
+    {"name": "валюта", "id": "face_unit"},
+]
+
+_table_style = dict(
+    style_cell={"fontFamily": "inherit", "fontSize": "0.9rem", "minWidth": "80px"},
+    style_header={"fontWeight": "bold"},
+    markdown_options={"link_target": "_self"},
+)
+
+
+def _summary_card(s) -> dbc.Col:
+    def row(label, value):
+        return dbc.Row([
+            dbc.Col(html.Span(label, className="text-muted")),
+            dbc.Col(value if value is not None else "-", width="auto"),
+        ])
+
+    return dbc.Col(dbc.Card([
+        dbc.CardHeader(f"итого, {currency_str(s.face_unit)}"),
+        dbc.CardBody([
+            row("стоимость", f"{s.value:,.2f}".replace(",", " ")),
+            row("доходность, %", s.ytm),
+            row("дюрация, лет", s.duration),
+            row("мод. дюрация", s.modified_duration),
+        ]),
+    ]), width=12, md=4)
+
+
+def _render(result: PortfolioResult, errors: list[str]):
+    messages = [
+        html.Div(f"Не найдены: {', '.join(result.not_found)}", className="text-danger") if result.not_found else None,
+        html.Div(f"Не распознаны строки: {'; '.join(errors)}", className="text-danger") if errors else None,
+    ]
+    positions = [
+        p._replace(shortname=f"[{p.shortname}](/calc/{p.secid})", face_unit=currency_str(p.face_unit))._asdict()
+        for p in result.positions
+    ]
+    calendar = [
+        c._replace(date=write_date(c.date), face_unit=currency_str(c.face_unit))._asdict()
+        for c in result.calendar
+    ]
+    return [
+        *[m for m in messages if m is not None],
+        dbc.Row([_summary_card(s) for s in result.summary], className="g-1 pt-1"),
+        html.H5("Позиции", className="pt-3"),
+        dash_table.DataTable(columns=_positions_columns, data=positions, sort_action="native", **_table_style),
+        html.H5("Выплаты", className="pt-3"),
+        dash_table.DataTable(
+            columns=_calendar_columns,
+            data=calendar,
+            virtualization=True,
+            fixed_rows={"headers": True},
+            page_action="none",
+            style_table={"height": "50vh", "overflowY": "auto"},
+            **_table_style,
+        ),
+    ]
+
+
+@callback(
+    Output("portfolio_holdings", "value"),
+    Input("portfolio_upload", "contents"),
+    prevent_initial_call=True,
+)
+def upload_holdings(contents: str):
+    # data:<mime>;base64,<content>
+    content = base64.b64decode(contents.split(",", 1)[1])
+    return content.decode("utf-8-sig", errors="replace")
+
+
+@callback(
+    Output("portfolio_result", "children"),
+    Input("portfolio_holdings", "value"),
+)
+@metrics.page_seconds.time(page="portfolio_results")
+def evaluate(text: str):
+    holdings, errors = parse_holdings(text or "")
+    if not holdings:
+        return html.Span("Добавьте облигации: по строке на позицию, «тикер или isin количество [цена покупки]»")
+    try:
+        return _render(portfolio_evaluate(holdings), errors)
+    except Exception as e:
+        logger.exception(f"Failed to evaluate portfolio of {len(holdings)} position(s): {e}")
+        return html.Span("Внутренняя ошибка", className="text-danger")
+
+
+@metrics.page_seconds.time(page="portfolio")
+def layout(**kwargs):
+    return [
+        dbc.Row([
+                dbc.Col(html.H3("Портфель", className="card-title")),
+                dbc.Col(
+                    dbc.Button(html.I(className="bi bi-search"), outline=True, href="/"),
+                    width="auto",
+                ),
+            ],
+            justify="between",
+            className="g-1 pt-1",
+        ),
+        dbc.Row([
+                dbc.Col(dbc.Textarea(
+                    id="portfolio_holdings",
+                    placeholder="SU26238RMFS 100 62.5\nRU000A105RV3 20",
+                    rows=6,
+                    debounce=True,
+                    persistence=True,
+                    persistence_type="local",
+                )),
+                dbc.Col(dcc.Upload(
+                    dbc.Button([html.I(className="bi bi-upload me-1"), "CSV"], outline=True),
+                    id="portfolio_upload",
+                    accept=".csv,.txt",
+                ), width="auto"),
+            ],
+            className="g-1 pt-1",
+        ),
+        dcc.Loading(html.Div(id="portfolio_result", className="pt-2")),
+    ]
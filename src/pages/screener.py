@@ -0,0 +1,206 @@
+from datetime import date
+
+import dash
+from dash import html, callback, ctx, dash_table, dcc, Input, Output, State
+import dash_bootstrap_components as dbc
+import logging
+
+from data import moex_bonds_db_screen, ScreenerFilter, BasicBondInfo, currency_str, write_optional_date, metrics
+
+dash.register_page(
+    __name__,
+    path='/screener',
+    title='BondsCalc | подбор'
+)
+
+logger = logging.getLogger(__name__)
+
+_page_size = 50
+
+_order_options = [
+    {"label": "доходность к погашению", "value": "ytm"},
+    {"label": "простая доходность", "value": "yield_to_redemption"},
+    {"label": "тек. доходность", "value": "current_yield"},
+    {"label": "купон", "value": "coupon_percent"},
+    {"label": "цена", "value": "price"},
+    {"label": "дней до погашения", "value": "days_to_redemption"},
+    {"label": "дата погашения", "value": "mat_date"},
+    {"label": "название", "value": "shortname"},
+]
+
+_columns = [
+    {"name": "название", "id": "shortname", "presentation": "markdown"},
+    {"name": "isin", "id": "isin"},
+    {"name": "листинг", "id": "list_level"},
+    {"name": "валюта", "id": "face_unit"},
+    {"name": "цена", "id": "price"},
+    {"name": "купон, %", "id": "coupon_percent"},
+    {"name": "тек. дох., %", "id": "current_yield"},
+    {"name": "YTM, %", "id": "ytm"},
+    {"name": "простая дох., %", "id": "yield_to_redemption"},
+    {"name": "погашение", "id": "redemption_date"},
+    {"name": "дней", "id": "days_to_redemption"},
+]
+
+
+def _to_row(bond: BasicBondInfo) -> dict:
+    m = bond.metrics
+    return {
+        "shortname": f"[{bond.shortname}](/calc/{bond.secid})",
+        "isin": bond.isin,
+        "list_level": bond.list_level,
+        "face_unit": currency_str(bond.face_unit),
+        "price": bond.prev_price,
+        "coupon_percent": bond.coupon_percent,
+        "current_yield": m.current_yield if m else None,
+        "ytm": m.ytm if m else None,
+        "yield_to_redemption": m.yield_to_redemption if m else None,
+        "redemption_date": write_optional_date(m.redemption_date) if m else None,
+        "days_to_redemption": m.days_to_redemption if m else None,
+    }
+
+
+def _optional_date(v: str | None) -> date | None:
+    return date.fromisoformat(v) if v else None
+
+
+@callback(
+    Output("screener_table", "data"),
+    Output("screener_cursor", "data"),
+    Output("screener_more", "disabled"),
+    Input("screener_list_level", "value"),
+    Input("screener_currency", "value"),
+    Input("screener_mat_from", "value"),
+    Input("screener_mat_till", "value"),
+    Input("screener_coupon_min", "value"),
+    Input("screener_coupon_max", "value"),
+    Input("screener_ytm_min", "value"),
+    Input("screener_ytm_max", "value"),
+    Input("screener_order", "value"),
+    Input("screener_descending", "value"),
+    Input("screener_more", "n_clicks"),
+    State("screener_table", "data"),
+    State("screener_cursor", "data"),
+)
+@metrics.page_seconds.time(page="screener_results")
+def screen(
+        list_levels, currencies, mat_from, mat_till, coupon_min, coupon_max, ytm_min, ytm_max,
+        order_by, descending, _more_clicks, rows, cursor,
+):
+    more = ctx.triggered_id == "screener_more"
+    f = ScreenerFilter(
+        list_levels=tuple(list_levels or ()),
+        currencies=tuple(currencies or ()),
+        mat_date_from=_optional_date(mat_from),
+        mat_date_till=_optional_date(mat_till),
+        coupon_min=coupon_min,
+        coupon_max=coupon_max,
+        ytm_min=ytm_min,
+        ytm_max=ytm_max,
+    )
+    page = moex_bonds_db_screen(
+        f,
+        order_by=order_by,
+        descending=descending,
+        after=tuple(cursor) if more and cursor else None,
+        limit=_page_size,
+    )
+    new_rows = [_to_row(b) for b in page.bonds]
+    return (rows or []) + new_rows if more else new_rows, page.cursor, page.cursor is None
+
+
+def _number_input(id: str, placeholder: str):
+    return dbc.Col(
+        dbc.FormFloating([
+            dbc.Input(type="number", id=id, placeholder=placeholder, debounce=True, persistence=True),
+            dbc.Label(placeholder),
+        ]),
+        width=6, md=3,
+    )
+
+
+def _date_input(id: str, placeholder: str):
+    return dbc.Col(
+        dbc.FormFloating([
+            dbc.Input(type="date", id=id, placeholder=placeholder, debounce=True, persistence=True),
+            dbc.Label(placeholder),
+        ]),
+        width=6, md=3,
+    )
+
+
+@metrics.page_seconds.time(page="screener")
+def layout(**kwargs):
+    return [
+        dbc.Row([
+                dbc.Col(html.H3("Подбор облигаций", className="card-title")),
+                dbc.Col(
+                    dbc.Button(html.I(className="bi bi-search"), outline=True, href="/"),
+                    width="auto",
+                ),
+            ],
+            justify="between",
+            className="g-1 pt-1",
+        ),
+        dbc.Row([
+                dbc.Col(dbc.Checklist(
+                    id="screener_list_level",
+                    options=[{"label": f"листинг {i}", "value": i} for i in (1, 2, 3)],
+                    value=[1, 2, 3],
+                    inline=True,
+                    persistence=True,
+                ), width="auto"),
+                dbc.Col(dbc.Checklist(
+                    id="screener_currency",
+                    options=[{"label": currency_str(c), "value": c} for c in ("SUR", "USD", "EUR", "CNY")],
+                    value=["SUR"],
+                    inline=True,
+                    persistence=True,
+                ), width="auto"),
+            ],
+            className="g-1 pt-1",
+        ),
+        dbc.Row([
+                _date_input("screener_mat_from", "погашение с"),
+                _date_input("screener_mat_till", "погашение по"),
+                _number_input("screener_coupon_min", "купон от, %"),
+                _number_input("screener_coupon_max", "купон до, %"),
+                _number_input("screener_ytm_min", "YTM от, %"),
+                _number_input("screener_ytm_max", "YTM до, %"),
+                dbc.Col(dbc.Select(
+                    id="screener_order",
+                    options=_order_options,
+                    value="ytm",
+                    persistence=True,
+                ), width=6, md=3, className="align-self-center"),
+                dbc.Col(dbc.RadioItems(
+                    id="screener_descending",
+                    options=[{"label": "по убыванию", "value": True}, {"label": "по возрастанию", "value": False}],
+                    value=True,
+                    inline=True,
+                    persistence=True,
+                ), width=6, md=3, className="align-self-center"),
+            ],
+            className="g-1 pt-1",
+        ),
+        dcc.Store(id="screener_cursor"),
+        dbc.Row(dbc.Col(
+            # virtualization renders only the rows in view, pages are appended by the button below
+            dash_table.DataTable(
+                id="screener_table",
+                columns=_columns,
+                data=[],
+                virtualization=True,
+                fixed_rows={"headers": True},
+                page_action="none",
+                markdown_options={"link_target": "_self"},
+                style_table={"height": "60vh", "overflowY": "auto"},
+                style_cell={"fontFamily": "inherit", "fontSize": "0.9rem", "minWidth": "80px"},
+                style_header={"fontWeight": "bold"},
+            ),
+        ), className="g-1 pt-2"),
+        dbc.Row(dbc.Col(
+            dbc.Button("ещё", id="screener_more", outline=True, disabled=True),
+            width="auto",
+        ), justify="center", className="g-1 pt-1"),
+    ]
@@ -1,11 +1,10 @@
-from typing import Any
-
 import dash
-from dash import html, callback, Input, Output
+from dash import html, dcc, callback, clientside_callback, ClientsideFunction, Input, Output
 import dash_bootstrap_components as dbc
 import logging
 
-from data import moex_bonds_db_search, BasicBondInfo, write_date, currency_str, write_optional_date
+from data import moex_bonds_db_search, BasicBondInfo, write_date, currency_str, write_optional_date, bonds_data_updated_at, write_datetime, \
+    metrics
 
 dash.register_page(
     __name__,
@@ -15,9 +14,8 @@ dash.register_page(
 
 logger = logging.getLogger(__name__)
 
-_perpetual_mat_date = html.Span("Бессрочно", className="text-danger")
-
-def _get_calc_link(bond: BasicBondInfo):
+def _to_record(bond: BasicBondInfo) -> dict:
+    """Plain values of one search result, rendered in the browser by search.js."""
     if bond.coupon_percent is not None:
         coupon_str = f'{bond.coupon_percent} %'
         coupon_left_suffix = f'• {bond.coupon_value} {currency_str(bond.face_unit)}'
@@ -25,89 +23,62 @@ def _get_calc_link(bond: BasicBondInfo):
         coupon_str = "-"
         coupon_left_suffix = ""
 
-    if bond.coupon_percent is not None and bond.prev_price is not None and bond.prev_price != 0:
-        cur_yield = f'{round(bond.coupon_percent / bond.prev_price * 100, 2)} %'
+    if bond.metrics is not None and bond.metrics.current_yield is not None:
+        cur_yield = f'{bond.metrics.current_yield} %'
     else:
         cur_yield = "-"
 
-    def col(children: Any):
-        return dbc.Col(children)
-    def auto_col(children: Any):
-        return dbc.Col(children, width="auto")
-
-    return dbc.ListGroupItem(
-        [
-            dbc.Row([
-                auto_col(html.H5(bond.shortname, className="card-title")),
-                # dbc.Col(html.Span("•", className="text-muted"), className="p-0", width="auto"),
-                dbc.Col(html.Small(bond.isin, className="text-muted"), className="p-0"),
-                auto_col(
-                    dbc.Badge(
-                        bond.list_level,
-                        pill=True,
-                        color="warning" if (int(bond.list_level) >= 3) else "success",
-                        className="me-1",
-                    ),
-                ),
-            ]),
-
-            dbc.Row([
-                col(html.Span("Погашение", className="text-muted")),
-                auto_col(write_optional_date(bond.mat_date) or _perpetual_mat_date)
-            ]),
-            #
-            # dbc.Row([
-            #     dbc.Col(html.Span("НКД", className="text-muted")),
-            #     dbc.Col(f'{bond.nkd} {currency_str(bond.face_unit)}', width="auto")
-            # ]),
-
-            dbc.Row([
-                col(html.Span("Выплата купона", className="text-muted")),
-                auto_col(write_date(bond.coupon_date))
-            ]),
-
-            dbc.Row([
-                col(html.Span(
-                    f'Купон {coupon_left_suffix}',
-                    className="text-muted")
-                ),
-                auto_col(coupon_str)
-            ]),
-
-            dbc.Row([
-                col(html.Span("Тек. доходность", className="text-muted")),
-                auto_col(html.B(cur_yield)),
-            ]),
-
-            dbc.Row([
-                col(html.Span("Цена", className="text-muted")),
-                auto_col(html.Span(
-                    bond.prev_price,
-                    className="text-danger" if ((bond.prev_price or 0) > 100) else ""
-                )),
-            ]),
-        ],
-        href=f"calc/{bond.secid}"
-    )
-
+    return {
+        "secid": bond.secid,
+        "shortname": bond.shortname,
+        "isin": bond.isin,
+        "list_level": bond.list_level,
+        # None for perpetual bonds
+        "mat_date": write_optional_date(bond.mat_date),
+        "coupon_date": write_date(bond.coupon_date),
+        "coupon": coupon_str,
+        "coupon_suffix": coupon_left_suffix,
+        "cur_yield": cur_yield,
+        "price": bond.prev_price,
+    }
+
+# search result is sent as plain records and turned into list items by clientside search.render,
+# which keeps the callback payload an order of magnitude smaller than a server-built component tree
 @callback(
-    Output("isin_search_result", "children"),
+    Output("isin_search_records", "data"),
     Input("isin_search", "value"),
 )
+@metrics.page_seconds.time(page="search_results")
 def search_isin(isin: str):
     if len(isin) < 3:
-        return html.Span("Введите минимум 3 символа")
+        return {"message": "Введите минимум 3 символа"}
     logger.info(f"Search bonds for query: '{isin}' ...")
     bonds = moex_bonds_db_search(isin)
     logger.info(f"Search bonds for query: '{isin}' - found {len(bonds)} bond(s)")
     if len(bonds) == 0:
-        return html.Span("Ничего не найдено"),
+        return {"message": "Ничего не найдено"}
     try:
-        return [_get_calc_link(bond) for bond in bonds]
+        return {"bonds": [_to_record(bond) for bond in bonds]}
     except Exception as e:
         logger.exception("Failed to process search query: " + isin, e)
-        return html.Span("Внутреннаая ошибка", className="text-danger")
+        return {"message": "Внутреннаая ошибка", "error": True}
+
+clientside_callback(
+    ClientsideFunction(
+        namespace='search',
+        function_name='render'
+    ),
+    Output("isin_search_result", "children"),
+    Input("isin_search_records", "data"),
+)
+
+def _data_updated_str() -> str:
+    updated_at = bonds_data_updated_at()
+    if updated_at is None:
+        return "Данные загружаются с МосБиржи..."
+    return f"Данные МосБиржи на {write_datetime(updated_at)}"
 
+@metrics.page_seconds.time(page="search")
 def layout(**kwargs):
     return [
         dbc.Row(
@@ -129,9 +100,21 @@ def layout(**kwargs):
                         size="lg",
                     ),
                 ),
+                dbc.Col(
+                    dbc.Button(html.I(className="bi bi-funnel"), outline=True, href="/screener", size="lg"),
+                    width="auto",
+                ),
+                dbc.Col(
+                    dbc.Button(html.I(className="bi bi-briefcase"), outline=True, href="/portfolio", size="lg"),
+                    width="auto",
+                ),
             ],
             className="g-1 pt-1 m-2",
         ),
+        dbc.Row(dbc.Col(
+            html.Small(_data_updated_str(), className="text-muted"),
+        ), className="g-1 m-2 mt-0",),
+        dcc.Store(id="isin_search_records"),
         dbc.Row(dbc.Col(
             dbc.ListGroup(
                 id="isin_search_result",
@@ -0,0 +1,37 @@
+import warnings
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from data import batch
+from data.moex import BasicBondInfo
+
+_bond = BasicBondInfo(
+    'ОФЗ 26238', 'SU26238RMFS', 'RU000A1038V6', date(2041, 5, 15), 7.1, 1, 35.4, date(2026, 11, 19), 10.0,
+    'SUR', 'SUR', 1000.0, 182, 1000000, None, 60.0, '26238RMFS', None,
+)
+
+
+@pytest.fixture(autouse=True)
+def bonds(monkeypatch):
+    monkeypatch.setattr(batch, 'moex_bonds_db_get', lambda secid: _bond if secid == _bond.secid else None)
+
+
+def test_dates_are_iso_only():
+    results = batch.batch_calculate([
+        {'secid': 'SU26238RMFS', 'sell_date': '01.02.2027', 'sell_price': 61},
+        {'secid': 'SU26238RMFS', 'sell_date': '2027-02-01', 'sell_price': 61},
+    ], date(2026, 10, 1))
+    assert results['error'][0] == 'sell_date must be a date as YYYY-MM-DD'
+    assert pd.isna(results['error'][1])
+    assert results['days'][1] == 123
+
+
+@pytest.mark.parametrize('scenarios', [[{}], [{'secid': 'SU00000RMFS'}], [{'secid': None, 'buy_price': [1]}]])
+def test_no_bond_found(scenarios):
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        results = batch.batch_calculate(scenarios, date(2026, 10, 1))
+    assert results['error'].notna().all()
+    assert results['profitability'].isna().all()
@@ -0,0 +1,19 @@
+from data.portfolio import Holding, parse_holdings
+
+
+def test_parse_holdings_separators():
+    text = 'SU26238RMFS 100 62.5\nSU26238RMFS,100,62.5\nSU26238RMFS;100;62.5\nru000a10b8j7 ; 3\n'
+    holdings, errors = parse_holdings(text)
+    assert holdings == [
+        Holding('SU26238RMFS', 100.0, 62.5),
+        Holding('SU26238RMFS', 100.0, 62.5),
+        Holding('SU26238RMFS', 100.0, 62.5),
+        Holding('RU000A10B8J7', 3.0, None),
+    ]
+    assert errors == []
+
+
+def test_parse_holdings_errors():
+    holdings, errors = parse_holdings('# comment\n\nSU26238RMFS 1.2.3\nSU26238RMFS,,\nSU26238RMFS\n')
+    assert holdings == []
+    assert errors == ['SU26238RMFS 1.2.3', 'SU26238RMFS,,', 'SU26238RMFS']